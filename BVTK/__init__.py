@@ -155,6 +155,9 @@ def on_frame_change(scene):
     for node_group in bpy.data.node_groups:
         for node in node_group.nodes:
             if node.bl_idname == 'BVTK_NT_ToBlender':
+                if node.output_type == "VOLUME" and node.use_baked_sequence:
+                    # The voxel texture plays back the baked frames
+                    continue
                 log.debug("Calling update without queue", draw_win=False)
                 bpy.ops.bvtk.node_update(
                     node_path=node_path(node),
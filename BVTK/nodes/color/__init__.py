@@ -7,6 +7,7 @@
 
 
 from .. core import *
+from .. converters.converter import is_composite, composite_leaves
 from bpy_extras.io_utils import ExportHelper, ImportHelper
 import bpy.utils.previews
 
@@ -55,25 +56,64 @@ class BVTK_NT_ColorMapper(Node, BVTK_NodePanels, BVTK_Node):
         # renaming or editing it may compromise them.
         if not self.auto_range:
             return
-        vtkobj = self.get_input_node("Input")[1]
-        if self.color_by and vtkobj:
-            vtkobj = resolve_algorithm_output(vtkobj)
-            if self.color_by[0] == "P":
-                d = vtkobj.GetPointData()
-            else:
-                d = vtkobj.GetCellData()
-            if d:
-                range = d.GetArray(int(self.color_by[1:])).GetRange()
+        datasets = self.color_datasets()
+        if self.color_by and datasets:
+            array = self.get_color_array(datasets[0])
+            if array:
+                range = array.GetRange(self.get_range_component(array))
+                # Blocks of composite data share the same range
+                for data in datasets[1:]:
+                    block_array = self.get_color_array(data, array.GetName())
+                    if block_array:
+                        block_range = block_array.GetRange(self.get_range_component(block_array))
+                        range = min(range[0], block_range[0]), max(range[1], block_range[1])
                 self.range_max = range[1]
                 self.range_min = range[0]
 
+    def color_datasets(self):
+        """Return a list with the input data or, for composite data
+        sets, with all their leaves. The arrays of the first data set
+        are the ones listed in 'color by'.
+        """
+        vtkobj = self.get_input_node("Input")[1]
+        if not vtkobj:
+            return []
+        vtkobj = resolve_algorithm_output(vtkobj)
+        if is_composite(vtkobj):
+            return [leaf for path, name, leaf in composite_leaves(vtkobj)]
+        return [vtkobj] if vtkobj else []
+
+    def get_color_array(self, data, array_name=None):
+        """Return the array of the given data selected in 'color by',
+        looking it up by name if one is given.
+        """
+        if not self.color_by or not hasattr(data, "GetPointData"):
+            return None
+        d = data.GetPointData() if self.color_by[0] == "P" else data.GetCellData()
+        if not d:
+            return None
+        if array_name:
+            return d.GetArray(array_name)
+        return d.GetArray(int(self.color_by[1:]))
+
+    def get_range_component(self, array):
+        """Return the component of the given array used for coloring,
+        in the format of vtkDataArray.GetRange (-1 for the magnitude).
+        """
+        n_components = array.GetNumberOfComponents()
+        if n_components < 2:
+            return 0
+        if 0 <= self.array_component < n_components:
+            return self.array_component
+        return -1
+
     def color_arrays(self, context=None):
         # Please note: this method is used by the batch scripts,
         # renaming or editing it may compromise them.
         items = []
-        vtkobj = self.get_input_node("Input")[1]
-        if vtkobj:
-            vtkobj = resolve_algorithm_output(vtkobj)
+        datasets = self.color_datasets()
+        if datasets:
+            vtkobj = datasets[0]
             if hasattr(vtkobj, "GetCellData"):
                 c_data = vtkobj.GetCellData()
                 p_data = vtkobj.GetPointData()
@@ -95,6 +135,9 @@ class BVTK_NT_ColorMapper(Node, BVTK_NodePanels, BVTK_Node):
                                                  ("IMAGE", "IMAGE", "IMAGE", "FILE_IMAGE", 1)],
                                           default="IMAGE")
     auto_range = bpy.props.BoolProperty(default=True, update=update_range)
+    array_component = bpy.props.IntProperty(default=-1, min=-1, name="Component", update=update_range,
+                                            description="Component of multi-component arrays used "
+                                                        "for coloring, -1 to use the magnitude")
     default_texture = bpy.props.StringProperty(default="")
     last_color_by = bpy.props.StringProperty(default='')
     range_max = bpy.props.FloatProperty(default=1, name="Range max")
@@ -113,7 +156,8 @@ class BVTK_NT_ColorMapper(Node, BVTK_NodePanels, BVTK_Node):
     def m_properties(self):
         return ["color_by", "texture_type", "auto_range",
                 "cl_enable", "range_min", "range_max", "cl_height",
-                "cl_width", "cl_font", "cl_div", "reset_materials"]
+                "cl_width", "cl_font", "cl_div", "reset_materials",
+                "array_component"]
 
     def m_connections(self):
         return ["Input"], [], [], ["Output"]
@@ -158,7 +202,8 @@ class BVTK_NT_ColorMapper(Node, BVTK_NodePanels, BVTK_Node):
             try_update_box(self, layout, "Input has no vtk object data\nTry to update.")
             return
 
-        vtk_obj = resolve_algorithm_output(vtk_obj)
+        datasets = self.color_datasets()
+        vtk_obj = datasets[0] if datasets else None
         if not hasattr(vtk_obj, "GetPointData"):
             try_update_box(self, layout, "Input has no associated data\nTry to update.")
             return
@@ -199,6 +244,11 @@ class BVTK_NT_ColorMapper(Node, BVTK_NodePanels, BVTK_Node):
 
         layout.prop(self, "texture_type")
         layout.prop(self, "color_by", text="Color by")
+        if self.color_by:
+            array = self.get_color_array(vtk_obj)
+            if array and array.GetNumberOfComponents() > 1:
+                row = aside_label(layout, "Component")
+                row.prop(self, "array_component", text="")
         layout.prop(self, "auto_range", text="Automatic range")
         col = layout.column(align=True)
         col.enabled = not self.auto_range
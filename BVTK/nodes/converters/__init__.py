@@ -11,6 +11,7 @@ from .. update import *
 
 _modules = [
     "converter",
+    "connectivity",
     "materials"
 ]
 
@@ -40,6 +41,56 @@ class BVTK_NT_ToBlender(bpy.types.Node, BVTK_Node):
             if self.z_level > z:
                 self.z_level = z
 
+    def stored_arrays_items(self, context=None):
+        items = [("NONE", "None", "Keep the colors generated by the color mapper")]
+        me = bpy.data.meshes.get(self.mesh_name)
+        if me:
+            for name, is_point_data, n_components in stored_arrays(me):
+                if is_point_data:
+                    items.append(("P"+name, name, "Display the stored point data array "+name,
+                                  "VERTEXSEL", len(items)))
+                else:
+                    items.append(("C"+name, name, "Display the stored cell data array "+name,
+                                  "FACESEL", len(items)))
+        return items
+
+    def point_arrays_items(self, n_components):
+        items = [("NONE", "None", "Don't use any array")]
+        data = self.get_input_data()
+        if hasattr(data, "GetPointData"):
+            p_data = data.GetPointData()
+            for i in range(p_data.GetNumberOfArrays()):
+                array = p_data.GetArray(i)
+                if array and array.GetNumberOfComponents() == n_components:
+                    arr_name = str(array.GetName())
+                    items.append((arr_name, arr_name, "Use point data array "+arr_name,
+                                  "VERTEXSEL", len(items)))
+        return items
+
+    def scalar_arrays_items(self, context=None):
+        return self.point_arrays_items(1)
+
+    def vector_arrays_items(self, context=None):
+        return self.point_arrays_items(3)
+
+    def update_slice_x(self, context):
+        self.show_slices("X")
+
+    def update_slice_y(self, context):
+        self.show_slices("Y")
+
+    def update_slice_z(self, context):
+        self.show_slices("Z")
+
+    def update_display_array(self, context):
+        color_node = self.get_color_mapper()
+        if self.display_array == "NONE" and color_node:
+            # Back to the colors of the color mapper
+            refresh_mesh_colors(self.mesh_name, color_node)
+        else:
+            self.show_display_array(color_node)
+        update_3d_view()
+
     mesh_name = bpy.props.StringProperty(name="Name", default="mesh")
     auto_update = bpy.props.BoolProperty(default=False, update=start_scan)
     smooth = bpy.props.BoolProperty(name="Smooth", default=False)
@@ -47,19 +98,96 @@ class BVTK_NT_ToBlender(bpy.types.Node, BVTK_Node):
         ("MESH", "Mesh", "Generate a mesh as output", "VIEW3D", 0),
         ("VOLUME", "Volume", "Generate a volume as output. Works only in blender render.", "MOD_CAST", 1),
         ("IMAGE", "Image", "Generate image as output.", "IMAGE_DATA", 2),
-        ("TEXT", "Text", "Generate a text object as output.", "FONT_DATA", 3)
+        ("TEXT", "Text", "Generate a text object as output.", "FONT_DATA", 3),
+        ("CURVE", "Curve", "Generate a curve from the lines of the input.", "CURVE_DATA", 4),
+        ("POINTS", "Points", "Generate a point cloud from the points of the input.", "PARTICLES", 5),
+        ("INSTANCES", "Instances", "Instance a glyph object on the points of the input.", "DUPLICATE", 6),
+        ("SLICES", "Slices", "Generate orthogonal slices of a volume, browsable without updating.",
+         "MOD_ARRAY", 7)
+    ])
+
+    # Mesh output options
+    mesh_engine = bpy.props.EnumProperty(name="Engine", default="BULK", items=[
+        ("BULK", "Bulk", "Load points and cells into the mesh as whole arrays"),
+        ("BMESH", "BMesh", "Legacy conversion, creating elements one by one (slow)")
     ])
+    k_slice = bpy.props.IntProperty(name="K slice", default=-1, min=-1,
+                                    description="Structured data only: k slice to convert, "
+                                                "-1 for the boundary surface")
+    store_arrays = bpy.props.BoolProperty(name="Store arrays", default=False,
+                                          description="Store point and cell data arrays in the mesh")
+    stored_array_names = bpy.props.StringProperty(name="Arrays", default="",
+                                                  description="Comma separated names of the arrays "
+                                                              "to store. Leave empty to store all of them")
+    display_array = bpy.props.EnumProperty(items=stored_arrays_items, name="Display",
+                                           update=update_display_array,
+                                           description="Color the mesh with a stored array, "
+                                                       "without updating the pipeline")
+
+    # Curve output options
+    radius_array = bpy.props.EnumProperty(items=scalar_arrays_items, name="Radius",
+                                          description="Point data array setting the radius of the curve")
+    tilt_array = bpy.props.EnumProperty(items=scalar_arrays_items, name="Tilt",
+                                        description="Point data array setting the tilt of the curve")
+    radius_scale = bpy.props.FloatProperty(name="Radius scale", default=1.0, min=0)
+    bevel_depth = bpy.props.FloatProperty(name="Bevel depth", default=0.0, min=0,
+                                          description="Bevel depth of the curve, multiplied by the "
+                                                      "radius of each point")
+    bevel_resolution = bpy.props.IntProperty(name="Bevel resolution", default=4, min=0, max=32)
+
+    # Points output options
+    max_points = bpy.props.IntProperty(name="Max points", default=0, min=0,
+                                       description="Maximum number of points to convert (0 for no limit)")
+    sampling = bpy.props.EnumProperty(name="Sampling", default="STRIDE", items=[
+        ("STRIDE", "Stride", "Take one point every n"),
+        ("RANDOM", "Random", "Take random points")
+    ])
+
+    # Instances output options
+    glyph_object = bpy.props.StringProperty(name="Glyph", default="",
+                                            description="Object instanced on each point, pointing along "
+                                                        "its z axis. Leave empty to use a default arrow")
+    vector_array = bpy.props.EnumProperty(items=vector_arrays_items, name="Orientation",
+                                          description="Point data array orienting the glyphs")
+    scale_array = bpy.props.EnumProperty(items=scalar_arrays_items, name="Scale",
+                                         description="Point data array scaling the glyphs")
+    scale_factor = bpy.props.FloatProperty(name="Scale factor", default=1.0, min=0)
 
     # Volume output options
     use_probing = bpy.props.BoolProperty(default=True, name="Probe")
     probe_resolution = bpy.props.IntVectorProperty(name="Resolution", default=(250, 250, 250))
     create_box = bpy.props.BoolProperty(default=True, name="Create box",
                                         description="Create a parallelepiped to display the generated volume")
+    quantize_volume = bpy.props.BoolProperty(default=False, name="8 bit",
+                                             description="Write the volume as raw 8 bit data instead "
+                                                         "of 32 bit floats")
+    crop_volume = bpy.props.BoolProperty(default=False, name="Crop",
+                                         description="Crop the volume to the voxels that are not "
+                                                     "fully transparent in the color ramp")
+    use_baked_sequence = bpy.props.BoolProperty(default=False, name="Use baked sequence",
+                                                description="Play back the baked volume sequence, "
+                                                            "without updating the node on frame change")
+
+    # Slices output options. Not listed in m_properties: changing the
+    # slices doesn't require an update.
+    slice_x = bpy.props.IntProperty(default=0, min=0, name="X", update=update_slice_x)
+    slice_y = bpy.props.IntProperty(default=0, min=0, name="Y", update=update_slice_y)
+    slice_z = bpy.props.IntProperty(default=0, min=0, name="Z", update=update_slice_z)
 
     # Image output options
     create_plane = bpy.props.BoolProperty(default=True, name="Create plane",
                                           description="Create a plane to display the generated image")
     z_level = bpy.props.IntProperty(default=1, min=1, update=update_z_level)
+    all_z_levels = bpy.props.BoolProperty(default=False, name="All levels",
+                                          description="Convert every z level into its own image, "
+                                                      "with the planes stacked at the level heights")
+    shader_colors = bpy.props.BoolProperty(default=False, name="Shader colors",
+                                           description="Store the raw values in a float image and map "
+                                                       "them to colors in the material, so that range "
+                                                       "and ramp edits don't convert the image again")
+    tile_size = bpy.props.IntProperty(default=0, min=0, name="Tile size", subtype="PIXEL",
+                                      description="Split images larger than this size in tiles, each "
+                                                  "one with its own image and plane (0 to disable)")
 
     # Image output and volume output options
     shift_x = bpy.props.FloatProperty(default=0, name="Shift x", subtype="PERCENTAGE", min=-100, max=100, soft_min=0)
@@ -67,11 +195,20 @@ class BVTK_NT_ToBlender(bpy.types.Node, BVTK_Node):
 
     def m_properties(self):
         return ["mesh_name", "smooth",
-                "z_level", "smooth",
+                "z_level", "mesh_engine",
+                "k_slice", "store_arrays",
+                "stored_array_names",
+                "radius_array", "tilt_array",
+                "radius_scale", "bevel_depth",
+                "bevel_resolution", "max_points",
+                "sampling", "glyph_object",
+                "vector_array", "scale_array",
+                "scale_factor",
                 "output_type", "use_probing",
                 "probe_resolution", "create_box",
-                "create_plane", "shift_x",
-                "shift_y"]
+                "quantize_volume", "crop_volume",
+                "all_z_levels", "create_plane", "shader_colors",
+                "tile_size", "shift_x", "shift_y"]
 
     def m_connections(self):
         return ["Input"], [], [], []
@@ -83,7 +220,51 @@ class BVTK_NT_ToBlender(bpy.types.Node, BVTK_Node):
         layout.prop(self, "smooth", text="Smooth")
         layout.prop(self, "output_type", text="Output as")
 
+        if self.output_type == "MESH":
+            layout.prop(self, "mesh_engine")
+            if self.mesh_engine == "BULK":
+                if is_structured(self.get_input_data()):
+                    layout.prop(self, "k_slice")
+                layout.prop(self, "store_arrays")
+                if self.store_arrays:
+                    layout.prop(self, "stored_array_names")
+                layout.prop(self, "display_array")
+
+        if self.output_type == "CURVE":
+            layout.prop(self, "radius_array")
+            layout.prop(self, "tilt_array")
+            col = layout.column(align=True)
+            col.prop(self, "radius_scale")
+            col.prop(self, "bevel_depth")
+            col.prop(self, "bevel_resolution")
+
+        if self.output_type == "INSTANCES":
+            layout.prop_search(self, "glyph_object", bpy.data, "objects")
+            layout.prop(self, "vector_array")
+            layout.prop(self, "scale_array")
+            layout.prop(self, "scale_factor")
+
+        if self.output_type in ("POINTS", "INSTANCES"):
+            row = layout.row(align=True)
+            row.prop(self, "max_points")
+            row.prop(self, "sampling", text="")
+
+        if self.output_type == "POINTS":
+            layout.prop(self, "store_arrays")
+            if self.store_arrays:
+                layout.prop(self, "stored_array_names")
+
         render_engine = bpy.context.scene.render.engine
+        if self.output_type == "SLICES":
+            layout.prop(self, "use_probing")
+            row = layout.row()
+            row.enabled = self.use_probing
+            row.prop(self, "probe_resolution")
+            col = layout.column(align=True)
+            col.prop(self, "slice_x")
+            col.prop(self, "slice_y")
+            col.prop(self, "slice_z")
+
         if self.output_type == "VOLUME":
             if render_engine == "CYCLES" or render_engine == "BLENDER_EEVEE":
                 enable_update = False
@@ -94,6 +275,13 @@ class BVTK_NT_ToBlender(bpy.types.Node, BVTK_Node):
             row.enabled = self.use_probing
             row.prop(self, "probe_resolution")
             layout.prop(self, "create_box")
+            row = layout.row(align=True)
+            row.prop(self, "quantize_volume", toggle=True)
+            row.prop(self, "crop_volume", toggle=True)
+            if find_time_selector(self):
+                row = layout.row(align=True)
+                row.prop(self, "use_baked_sequence", text="Baked")
+                high_op(row, "bvtk.bake_volume", text="Bake sequence").node_path = node_path(self)
 
         if self.output_type == "VOLUME" or self.output_type == "IMAGE":
             col = layout.column(align=True)
@@ -107,17 +295,34 @@ class BVTK_NT_ToBlender(bpy.types.Node, BVTK_Node):
             if hasattr(data, "GetDimensions"):
                 z = data.GetDimensions()[2]
                 row = layout.split(percentage=0.3)
+                row.enabled = not self.all_z_levels
                 row.prop(self, "z_level", text="")
                 row.label(text="Max: {}".format(z))
+                layout.prop(self, "all_z_levels")
 
             layout.prop(self, "create_plane")
+            layout.prop(self, "shader_colors")
+            layout.prop(self, "tile_size")
 
-        row = layout.row()
+        row = layout.row(align=True)
         row.enabled = enable_update
         high_op(row, "bvtk.node_update", text="Update").node_path = node_path(self)
+        op = high_op(row, "bvtk.color_refresh", text="", icon="COLOR")
+        op.node_path = node_path(self)
 
-    def update_cb(self):
-        """Update node"""
+    def get_input_data(self):
+        """Return the input data, skipping the color mapper node
+        if there is one, without updating any node.
+        """
+        input_node, input_obj = self.get_input_node("Input")
+        if input_node and input_node.bl_idname == "BVTK_NT_ColorMapper":
+            input_obj = input_node.get_input_node("Input")[1]
+        return resolve_algorithm_output(input_obj)
+
+    def get_color_input(self):
+        """Return the color mapper node connected in input (or None)
+        and the input object, resolved from the algorithm output.
+        """
         input_node, input_obj = self.get_input_node("Input")
         color_node = None
 
@@ -128,29 +333,188 @@ class BVTK_NT_ToBlender(bpy.types.Node, BVTK_Node):
 
         if input_obj is not None:
             input_obj = resolve_algorithm_output(input_obj)
-            output_type = self.output_type
-            mesh_name = self.mesh_name
-            shift = -self.shift_x/100, self.shift_y/100
-
-            if output_type == "MESH":
-                vtk_data_to_mesh(input_obj, mesh_name, color_node, self.smooth)
-            elif output_type == "VOLUME":
-                vtk_data_to_volume(input_obj, mesh_name, color_node, use_probing=self.use_probing,
-                                   probe_resolution=self.probe_resolution, shift=shift,
-                                   create_box=self.create_box)
-            elif output_type == "IMAGE":
-                vtk_data_to_image(input_obj, mesh_name, color_node, shift, self.create_plane,
-                                  self.z_level-1)
-            elif output_type == "TEXT":
-                vtk_data_to_text(input_obj, mesh_name)
-
-            if color_node and color_node.cl_enable:
-                create_color_legend(mesh_name, color_node, color_node.cl_div,
-                                    color_node.cl_font, color_node.cl_width,
-                                    color_node.cl_height, color_node.cl_font_size)
 
+        return color_node, input_obj
+
+    def convert(self, input_obj, color_node):
+        """Convert the input object according to the output type."""
+        output_type = self.output_type
+        mesh_name = self.mesh_name
+        shift = -self.shift_x/100, self.shift_y/100
+
+        if output_type == "MESH" and is_composite(input_obj):
+            vtk_data_to_blocks(input_obj, mesh_name, color_node, self.smooth, self.k_slice,
+                               self.mesh_engine, self.store_arrays, self.get_stored_array_names())
+        elif output_type == "MESH":
+            if self.mesh_engine == "BMESH":
+                vtk_data_to_bmesh(input_obj, mesh_name, color_node, self.smooth)
+            else:
+                vtk_data_to_mesh(input_obj, mesh_name, color_node, self.smooth,
+                                 self.store_arrays, self.get_stored_array_names(), self.k_slice)
+                self.show_display_array(color_node)
+        elif output_type == "VOLUME":
+            vtk_data_to_volume(input_obj, mesh_name, color_node, use_probing=self.use_probing,
+                               probe_resolution=self.probe_resolution, shift=shift,
+                               create_box=self.create_box, quantize=self.quantize_volume,
+                               crop=self.crop_volume)
+        elif output_type == "IMAGE":
+            vtk_data_to_image(input_obj, mesh_name, color_node, shift, self.create_plane,
+                              self.z_level-1, self.shader_colors, self.tile_size,
+                              all_levels=self.all_z_levels)
+        elif output_type == "SLICES":
+            vtk_data_to_slices(input_obj, mesh_name, color_node, (self.slice_x, self.slice_y, self.slice_z),
+                               self.use_probing, self.probe_resolution)
+        elif output_type == "TEXT":
+            vtk_data_to_text(input_obj, mesh_name)
+        elif output_type == "POINTS":
+            vtk_data_to_points(input_obj, mesh_name, self.max_points, self.sampling,
+                               self.store_arrays, self.get_stored_array_names())
+        elif output_type == "INSTANCES":
+            vtk_data_to_instances(input_obj, mesh_name,
+                                  "" if self.vector_array == "NONE" else self.vector_array,
+                                  "" if self.scale_array == "NONE" else self.scale_array,
+                                  self.scale_factor, self.glyph_object,
+                                  self.max_points, self.sampling)
+        elif output_type == "CURVE":
+            if color_node:
+                log.warning("Colors are not supported by the curve output.", draw_win=False)
+            vtk_data_to_curve(input_obj, mesh_name,
+                              "" if self.radius_array == "NONE" else self.radius_array,
+                              "" if self.tilt_array == "NONE" else self.tilt_array,
+                              self.radius_scale, self.bevel_depth, self.bevel_resolution)
+
+    def get_stored_array_names(self):
+        return [name.strip() for name in self.stored_array_names.split(",") if name.strip()]
+
+    def show_display_array(self, color_node=None):
+        """Color the output mesh with the selected stored array."""
+        me = bpy.data.meshes.get(self.mesh_name)
+        if not me or self.display_array in ("", "NONE"):
+            return
+        show_stored_array(me, self.display_array[1:], self.display_array[0] == "P", color_node)
+
+    def update_color_legend(self, color_node):
+        if color_node and color_node.cl_enable:
+            create_color_legend(self.mesh_name, color_node, color_node.cl_div,
+                                color_node.cl_font, color_node.cl_width,
+                                color_node.cl_height, color_node.cl_font_size)
+
+    def update_cb(self):
+        """Update node"""
+        if self.output_type == "VOLUME" and self.use_baked_sequence:
+            log.info("Playing back the baked volume sequence: disable 'Baked' "
+                     "to update the volume.", draw_win=False)
+            return
+
+        color_node, input_obj = self.get_color_input()
+
+        if input_obj is not None:
+            self.convert(input_obj, color_node)
+            self.update_color_legend(color_node)
             update_3d_view()
 
+    def color_update_cb(self):
+        """Update only the colors of the output. The data currently
+        stored in the pipeline is used as it is, without executing the
+        input nodes; mesh geometry is not converted again.
+        """
+        color_node, input_obj = self.get_color_input()
+
+        if not color_node:
+            log.warning("Connect a color mapper node to refresh colors.")
+            return
+
+        if input_obj is None:
+            return
+
+        if self.output_type == "VOLUME" and self.use_baked_sequence:
+            # The baked frames are already normalized and the voxel
+            # texture follows the ramp: converting the current frame
+            # would replace the sequence
+            log.info("Playing back the baked volume sequence: bake it again "
+                     "to change its range.", draw_win=False)
+        elif self.output_type == "MESH":
+            if not refresh_mesh_colors(self.mesh_name, color_node):
+                log.info("Mesh data not available, performing a full update.", draw_win=False)
+                no_queue_update(self, self.update_cb)
+                return
+            self.show_display_array(color_node)
+        elif self.output_type == "IMAGE" and self.shader_colors:
+            # Only the material nodes need to be updated
+            texture = color_node.get_texture()
+            data_range = color_node.range_min, color_node.range_max
+            if not texture or data_range[0] == data_range[1] or \
+                    not refresh_image_materials(self.mesh_name, texture.color_ramp, data_range):
+                self.convert(input_obj, color_node)
+        elif self.output_type == "SLICES":
+            # The cached volume is normalized again in the new range
+            data_range = color_node.range_min, color_node.range_max
+            if color_node.auto_range or data_range[0] == data_range[1] or \
+                    not set_slices_range(self.mesh_name, data_range):
+                self.convert(input_obj, color_node)
+            else:
+                self.show_slices()
+        elif self.output_type not in ("TEXT", "CURVE", "POINTS", "INSTANCES"):
+            # Image and volume outputs are made of colors only
+            self.convert(input_obj, color_node)
+
+        self.update_color_legend(color_node)
+        update_3d_view()
+
+    def get_color_mapper(self):
+        """Return the color mapper connected to the input, if any."""
+        input_node = self.get_input_node("Input")[0]
+        if input_node and input_node.bl_idname == "BVTK_NT_ColorMapper":
+            return input_node
+        return None
+
+    def show_slices(self, axes="XYZ"):
+        """Show the slices of the cached volume at the current indices,
+        without executing the pipeline.
+        """
+        color_node = self.get_color_mapper()
+        if not update_slices(self.mesh_name, color_node, (self.slice_x, self.slice_y, self.slice_z), axes):
+            log.info("Update the node to cache the volume to slice.", draw_win=False)
+            return
+        update_3d_view()
+
+    def bake_volume_cb(self):
+        """Bake every time step of the time selector node in input
+        into a single volume sequence file.
+        """
+        time_node = find_time_selector(self)
+        time_steps = time_node.get_time_steps() if time_node else None
+        if not time_steps:
+            log.error("Connect a time selector node with valid time steps "
+                      "to bake a volume sequence (try updating).")
+            return
+
+        if self.quantize_volume or self.crop_volume:
+            log.warning("8 bit and crop options are not supported by volume sequences: "
+                        "the frames are baked as 32 bit floats, uncropped.", draw_win=False)
+
+        last_time_step = time_node.time_step
+        shift = -self.shift_x/100, self.shift_y/100
+        color_node = self.get_color_input()[0]
+
+        def frames():
+            for i in range(len(time_steps)):
+                time_node.time_step = i
+                input_obj = []
+                no_queue_update(self, lambda: input_obj.append(self.get_color_input()[1]))
+                yield input_obj[0]
+
+        try:
+            baked = vtk_data_to_volume_sequence(frames(), len(time_steps), self.mesh_name,
+                                                color_node, use_probing=self.use_probing,
+                                                probe_resolution=self.probe_resolution,
+                                                shift=shift, create_box=self.create_box)
+        finally:
+            time_node.time_step = last_time_step
+
+        self.use_baked_sequence = baked
+        update_3d_view()
+
     def apply_properties(self, vtkobj):
         pass
 
@@ -158,6 +522,19 @@ class BVTK_NT_ToBlender(bpy.types.Node, BVTK_Node):
         pass
 
 
+def find_time_selector(node):
+    """Search the nodes in input of the given node for a
+    time selector node and return it (or None).
+    """
+    for input_node in node.input_nodes():
+        if input_node.bl_idname == "BVTK_NT_TimeSelector":
+            return input_node
+        time_node = find_time_selector(input_node)
+        if time_node:
+            return time_node
+    return None
+
+
 # ---------------------------------------------------------------------------------
 #   Operator add socket
 # ---------------------------------------------------------------------------------
@@ -265,6 +642,36 @@ class BVTK_OT_NodeUpdate(bpy.types.Operator):
         return {'FINISHED'}
 
 
+class BVTK_OT_ColorRefresh(bpy.types.Operator):
+    """Refresh only the colors of the output, without executing the pipeline"""
+    bl_idname = "bvtk.color_refresh"
+    bl_label = "Refresh colors"
+    node_path = bpy.props.StringProperty()
+
+    def execute(self, context):
+        check_cache()
+        node = eval(self.node_path)
+        if node and hasattr(node, "color_update_cb"):
+            log.info('Refreshing colors from {}'.format(node.name))
+            node.color_update_cb()
+        return {'FINISHED'}
+
+
+class BVTK_OT_BakeVolume(bpy.types.Operator):
+    """Bake all the time steps of the input into a volume sequence"""
+    bl_idname = "bvtk.bake_volume"
+    bl_label = "Bake volume sequence"
+    node_path = bpy.props.StringProperty()
+
+    def execute(self, context):
+        check_cache()
+        node = eval(self.node_path)
+        if node and hasattr(node, "bake_volume_cb"):
+            log.info('Baking volume sequence from {}'.format(node.name))
+            node.bake_volume_cb()
+        return {'FINISHED'}
+
+
 # ---------------------------------------------------------------------------------
 #   Operator Write
 # ---------------------------------------------------------------------------------
@@ -348,6 +755,24 @@ def differences(map1, map2):
     return props, inputs
 
 
+# Nodes whose properties only affect the colors of the output
+color_node_types = ("BVTK_NT_ColorMapper", "BVTK_NT_ColorRamp")
+
+
+def color_only_differences(tree, props, inputs):
+    """Return true if the given differences (see the differences
+    function) only involve properties of color nodes.
+    """
+    if inputs:
+        return False
+    for node_name in props:
+        if node_name not in tree:
+            return False
+        if tree[node_name].bl_idname not in color_node_types:
+            return False
+    return True
+
+
 def compare(dict1, dict2):
     """Compare two dictionaries. Return a list of mismatching keys."""
     diff = []
@@ -383,7 +808,14 @@ class BVTK_OT_AutoUpdateScan(bpy.types.Operator):
                     self.last_map = actual_map
                     check_cache()
                     try:
-                        no_queue_update(self.node, self.node.update_cb)
+                        if color_only_differences(self.tree, props, conn):
+                            log.disable_draw_win()
+                            try:
+                                self.node.color_update_cb()
+                            finally:
+                                log.enable_draw_win()
+                        else:
+                            no_queue_update(self.node, self.node.update_cb)
                     except Exception as e:
                         log.error('ERROR UPDATING ' + str(e))
             else:
@@ -417,6 +849,8 @@ cat = "Converters"
 add_node(BVTK_NT_ToBlender, cat)
 register.set_category_icon(cat, "APPEND_BLEND")
 register.add_class(BVTK_OT_NodeUpdate)
+register.add_class(BVTK_OT_ColorRefresh)
+register.add_class(BVTK_OT_BakeVolume)
 register.add_class(BVTK_OT_AutoUpdateScan)
 register.add_class(BVTK_OT_NodeWrite)
 register.add_class(BVTK_OT_AddSocket)
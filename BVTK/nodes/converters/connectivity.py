@@ -0,0 +1,377 @@
+# <pep8 compliant>
+# ---------------------------------------------------------------------------------
+#   converters/connectivity.py
+#
+#   Define functions to read VTK points and cells as numpy arrays.
+# ---------------------------------------------------------------------------------
+
+
+import numpy as np
+import zlib
+from vtk.util.numpy_support import vtk_to_numpy
+
+
+# ---------------------------------------------------------------------------------
+#   Points
+# ---------------------------------------------------------------------------------
+
+
+def points_to_numpy(data):
+    """Return the points of the given vtk data as a float32
+    numpy array with shape (n, 3).
+    """
+    points = data.GetPoints()
+    if not points or not points.GetNumberOfPoints():
+        return np.zeros((0, 3), dtype=np.float32)
+    coords = vtk_to_numpy(points.GetData())
+    return coords.astype(np.float32, copy=False).reshape(-1, 3)
+
+
+# ---------------------------------------------------------------------------------
+#   Cell arrays
+# ---------------------------------------------------------------------------------
+
+
+def legacy_cell_starts(buffer):
+    """Find the position of every cell header inside a legacy
+    [n, id_0, ..., id_n-1, n, id_0, ...] cell array buffer.
+    """
+    size = len(buffer)
+    if not size:
+        return np.zeros(0, dtype=np.int64)
+
+    # Fast path: all the cells have the same number of points
+    # (e.g. a triangulated surface).
+    n = int(buffer[0])
+    if size % (n + 1) == 0 and np.all(buffer[::n + 1] == n):
+        return np.arange(0, size, n + 1, dtype=np.int64)
+
+    # Every position of the buffer is considered as a header pointing
+    # to the following one: only the chain that starts from 0 is
+    # meaningful. The chain is followed doubling the jump length at
+    # every step, so that only log2(n_cells) numpy passes are needed.
+    jump = np.arange(size, dtype=np.int64) + buffer + 1
+    np.minimum(jump, size, out=jump)
+    jump = np.append(jump, size)  # Sentinel
+    starts = np.zeros(1, dtype=np.int64)
+    while True:
+        following = jump[starts]
+        following = following[following < size]
+        if not len(following):
+            break
+        starts = np.concatenate((starts, following))
+        jump = jump[jump]
+    starts.sort()
+    return starts
+
+
+def cell_array_to_numpy(cell_array):
+    """Read a vtkCellArray and return a tuple of numpy arrays
+    (offsets, counts, connectivity), where offsets are the positions
+    of the first point id of each cell inside connectivity.
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    if not cell_array or not cell_array.GetNumberOfCells():
+        return empty, empty, empty
+
+    if hasattr(cell_array, "GetOffsetsArray"):
+        # VTK 9 stores offsets and connectivity separately
+        offsets = vtk_to_numpy(cell_array.GetOffsetsArray()).astype(np.int64, copy=False)
+        connectivity = vtk_to_numpy(cell_array.GetConnectivityArray()).astype(np.int64, copy=False)
+        return offsets[:-1], np.diff(offsets), connectivity
+
+    buffer = vtk_to_numpy(cell_array.GetData()).astype(np.int64, copy=False)
+    starts = legacy_cell_starts(buffer)
+    counts = buffer[starts]
+    # Each header removed before a cell moves its ids back by one
+    offsets = starts - np.arange(len(starts), dtype=np.int64)
+    mask = np.ones(len(buffer), dtype=bool)
+    mask[starts] = False
+    return offsets, counts, buffer[mask]
+
+
+def lines_to_edges(offsets, counts, connectivity):
+    """Split polylines into their segments and return them
+    as a (n, 2) numpy array of point ids.
+    """
+    if len(connectivity) < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+    # A couple of consecutive ids is a segment unless it
+    # crosses the boundary between two lines.
+    valid = np.ones(len(connectivity) - 1, dtype=bool)
+    last = offsets + counts - 1
+    valid[last[last < len(valid)]] = False
+    return np.column_stack((connectivity[:-1][valid], connectivity[1:][valid]))
+
+
+def cell_array_checksum(cell_array):
+    """Return a string identifying the content of a vtkCellArray:
+    number of cells and checksum of the raw connectivity buffers.
+    """
+    if not cell_array or not cell_array.GetNumberOfCells():
+        return "0"
+    if hasattr(cell_array, "GetOffsetsArray"):
+        buffers = (cell_array.GetOffsetsArray(), cell_array.GetConnectivityArray())
+    else:
+        buffers = (cell_array.GetData(),)
+    checksum = 0
+    for buffer in buffers:
+        checksum = zlib.crc32(np.ascontiguousarray(vtk_to_numpy(buffer)), checksum)
+    return "{}:{:08x}".format(cell_array.GetNumberOfCells(), checksum)
+
+
+def topology_fingerprint(data):
+    """Return a string identifying the topology of the given
+    vtkPolyData, without decoding its cells. Two data sets with
+    the same fingerprint differ at most by point coordinates
+    and attributes.
+    """
+    parts = [str(data.GetNumberOfPoints())]
+    for cell_array in (data.GetVerts(), data.GetLines(),
+                       data.GetPolys(), data.GetStrips()):
+        parts.append(cell_array_checksum(cell_array))
+    return " ".join(parts)
+
+
+def geometry_fingerprint(data):
+    """Return a string identifying the geometry of a vtkPointSet:
+    point coordinates and cells. Two data sets with the same
+    fingerprint differ at most by attributes. Return None for
+    data sets without explicit points.
+    """
+    if not data.IsA("vtkPointSet") or not data.GetPoints():
+        return None
+    points = np.ascontiguousarray(vtk_to_numpy(data.GetPoints().GetData()))
+    parts = [data.GetClassName(), "{}:{:08x}".format(len(points), zlib.crc32(points))]
+    if data.IsA("vtkPolyData"):
+        parts.append(topology_fingerprint(data))
+    elif data.IsA("vtkUnstructuredGrid"):
+        parts.append(cell_array_checksum(data.GetCells()))
+        types = np.ascontiguousarray(vtk_to_numpy(data.GetCellTypesArray()))
+        parts.append("{:08x}".format(zlib.crc32(types)))
+    elif data.IsA("vtkStructuredGrid"):
+        parts.append("{}x{}x{}".format(*data.GetDimensions()))
+    return " ".join(parts)
+
+
+def array_checksum(array):
+    """Return a string identifying the content of a numeric vtk
+    data array: size and checksum of the raw values.
+    """
+    values = np.ascontiguousarray(vtk_to_numpy(array))
+    return "{}x{}:{:08x}".format(array.GetNumberOfTuples(), array.GetNumberOfComponents(),
+                                 zlib.crc32(values))
+
+
+def data_fingerprint(data):
+    """Return a string identifying the geometry of a vtkDataSet, like
+    geometry_fingerprint, also for grids with implicit points: image
+    data are identified by origin, spacing and extent, rectilinear
+    grids by their coordinates. Return None if not available.
+    """
+    if data.IsA("vtkImageData"):
+        return "{} {} {} {}".format(data.GetClassName(), tuple(data.GetOrigin()),
+                                    tuple(data.GetSpacing()), tuple(data.GetExtent()))
+    if data.IsA("vtkRectilinearGrid"):
+        parts = [data.GetClassName(), "{}x{}x{}".format(*data.GetDimensions())]
+        for coords in (data.GetXCoordinates(), data.GetYCoordinates(), data.GetZCoordinates()):
+            parts.append(array_checksum(coords))
+        return " ".join(parts)
+    return geometry_fingerprint(data)
+
+
+def local_indices(offsets, counts, size):
+    """Return, for each position of a connectivity array,
+    its index inside the cell it belongs to.
+    """
+    return np.arange(size, dtype=np.int64) - np.repeat(offsets, counts)
+
+
+def strips_to_triangles(offsets, counts, connectivity):
+    """Expand triangle strips into triangles. Return a (n, 3) array
+    of point ids and the index of the strip generating each triangle.
+    """
+    local = local_indices(offsets, counts, len(connectivity))
+    # A strip of n points generates n-2 triangles, each starting
+    # from one of its first n-2 points.
+    first = np.nonzero(local < np.repeat(counts - 2, counts))[0]
+    triangles = np.column_stack((connectivity[first],
+                                 connectivity[first + 1],
+                                 connectivity[first + 2]))
+    # Every other triangle has the opposite winding
+    odd = local[first] % 2 == 1
+    triangles[odd, :2] = triangles[odd, 1::-1]
+    strip_ids = np.repeat(np.arange(len(counts), dtype=np.int64), np.maximum(counts - 2, 0))
+    return triangles, strip_ids
+
+
+# ---------------------------------------------------------------------------------
+#   Poly data decoding
+# ---------------------------------------------------------------------------------
+
+
+class PolyDataCells:
+    """Cells of a vtkPolyData split by type, as numpy arrays.
+    Faces are stored as (offsets, counts, connectivity), edges as
+    a (n, 2) array and vertices as a flat array of point ids. Face
+    and edge cell ids refer to the original vtk cell numbering
+    (vertices, then lines, polygons and strips), so that cell data
+    can be mapped on the Blender elements.
+    """
+
+    def __init__(self):
+        empty = np.zeros(0, dtype=np.int64)
+        self.faces = (empty, empty, empty)
+        self.face_cells = empty
+        self.edges = np.zeros((0, 2), dtype=np.int64)
+        self.edge_cells = empty
+        self.verts = empty
+
+
+def decode_polydata(data):
+    """Read all the cell arrays of the given vtkPolyData and
+    return them decoded in a PolyDataCells object.
+    """
+    cells = PolyDataCells()
+    first_id = 0
+
+    # Vertices and poly vertices
+    offsets, counts, connectivity = cell_array_to_numpy(data.GetVerts())
+    cells.verts = connectivity
+    first_id += len(counts)
+
+    # Lines and poly lines: one edge for each segment
+    offsets, counts, connectivity = cell_array_to_numpy(data.GetLines())
+    if len(counts):
+        cells.edges = lines_to_edges(offsets, counts, connectivity)
+        segments = np.maximum(counts - 1, 0)
+        cells.edge_cells = first_id + np.repeat(np.arange(len(counts), dtype=np.int64), segments)
+    first_id += len(counts)
+
+    # Polygons, discarding the ones with less than three points
+    offsets, counts, connectivity = cell_array_to_numpy(data.GetPolys())
+    poly_cells = first_id + np.arange(len(counts), dtype=np.int64)
+    valid = counts > 2
+    if not np.all(valid):
+        connectivity = connectivity[np.repeat(valid, counts)]
+        counts = counts[valid]
+        poly_cells = poly_cells[valid]
+    first_id += len(valid)
+
+    # Triangle strips, expanded to triangles
+    s_offsets, s_counts, s_connectivity = cell_array_to_numpy(data.GetStrips())
+    if len(s_counts):
+        triangles, strip_ids = strips_to_triangles(s_offsets, s_counts, s_connectivity)
+        connectivity = np.concatenate((connectivity, triangles.ravel()))
+        counts = np.concatenate((counts, np.full(len(triangles), 3, dtype=np.int64)))
+        poly_cells = np.concatenate((poly_cells, first_id + strip_ids))
+
+    offsets = np.cumsum(counts) - counts
+    cells.faces = (offsets, counts, connectivity)
+    cells.face_cells = poly_cells
+    return cells
+
+
+# ---------------------------------------------------------------------------------
+#   Structured data
+# ---------------------------------------------------------------------------------
+
+
+def is_structured(data):
+    """Return true if the data is a structured data set (image
+    data, structured or rectilinear grid), whose topology can be
+    deduced from its dimensions alone.
+    """
+    if not hasattr(data, "IsA") or not hasattr(data, "GetDimensions"):
+        return False
+    return any(data.IsA(c) for c in ("vtkImageData", "vtkStructuredGrid",
+                                     "vtkRectilinearGrid"))
+
+
+def structured_points(data, point_ids):
+    """Return the coordinates of the given points of a structured data
+    set as a float32 (n, 3) array. Image data and rectilinear grids
+    coordinates are computed from the point indices.
+    """
+    if data.IsA("vtkStructuredGrid"):
+        return points_to_numpy(data)[point_ids]
+
+    nx, ny, nz = data.GetDimensions()
+    ijk = np.column_stack((point_ids % nx, point_ids // nx % ny, point_ids // (nx*ny)))
+
+    if data.IsA("vtkRectilinearGrid"):
+        coordinates = (data.GetXCoordinates(), data.GetYCoordinates(), data.GetZCoordinates())
+        coords = np.empty((len(point_ids), 3), dtype=np.float32)
+        for axis, array in enumerate(coordinates):
+            coords[:, axis] = vtk_to_numpy(array)[ijk[:, axis]]
+        return coords
+
+    # Image indices start from the extent minimum, not from 0
+    ijk = ijk + np.array(data.GetExtent()[::2])
+    coords = ijk * np.array(data.GetSpacing())
+    if hasattr(data, "GetDirectionMatrix"):
+        matrix = data.GetDirectionMatrix()
+        direction = np.array([[matrix.GetElement(r, c) for c in range(3)] for r in range(3)])
+        coords = np.dot(coords, direction.T)
+    coords += np.array(data.GetOrigin())
+    return coords.astype(np.float32)
+
+
+def structured_surface(dims, k_slice=-1):
+    """Generate the boundary quads of a structured data set with the
+    given dimensions or, if k_slice is not negative, the quads of
+    that k slice. Return the ids of the points used, the faces as an
+    (offsets, counts, connectivity) tuple indexing those points and
+    the id of the cell each quad belongs to.
+    """
+    dims = np.array(dims, dtype=np.int64)
+    cell_dims = np.maximum(dims - 1, 1)
+
+    # Sheets of quads, as (normal axis, index along the axis, flip).
+    # A flat dimension gives a single sheet, otherwise both sides are
+    # taken, flipping the lower one so that normals point outwards.
+    if k_slice >= 0:
+        sheets = [(2, min(k_slice, dims[2] - 1), False)]
+    else:
+        sheets = []
+        for axis in range(3):
+            if dims[axis] == 1:
+                sheets.append((axis, 0, False))
+            else:
+                sheets.append((axis, 0, True))
+                sheets.append((axis, dims[axis] - 1, False))
+
+    quads = []
+    cells = []
+    for a, index, flip in sheets:
+        b, c = (a + 1) % 3, (a + 2) % 3
+        if dims[b] < 2 or dims[c] < 2:
+            continue
+        ib, ic = np.meshgrid(np.arange(dims[b] - 1), np.arange(dims[c] - 1), indexing="ij")
+        ib, ic = ib.ravel(), ic.ravel()
+
+        corners = [(ib, ic), (ib + 1, ic), (ib + 1, ic + 1), (ib, ic + 1)]
+        if flip:
+            corners.reverse()
+        quad = np.empty((len(ib), 4), dtype=np.int64)
+        for n, (pb, pc) in enumerate(corners):
+            ijk = [None] * 3
+            ijk[a], ijk[b], ijk[c] = index, pb, pc
+            quad[:, n] = ijk[0] + dims[0] * (ijk[1] + dims[1] * ijk[2])
+        quads.append(quad)
+
+        ijk = [None] * 3
+        ijk[a], ijk[b], ijk[c] = min(index, cell_dims[a] - 1), ib, ic
+        cells.append(ijk[0] + cell_dims[0] * (ijk[1] + cell_dims[1] * ijk[2]))
+
+    if not quads:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, (empty, empty, empty), empty
+
+    quads = np.concatenate(quads)
+    point_ids, connectivity = np.unique(quads.ravel(), return_inverse=True)
+    n_quads = len(quads)
+    faces = (np.arange(0, 4 * n_quads, 4, dtype=np.int64),
+             np.full(n_quads, 4, dtype=np.int64),
+             connectivity.astype(np.int64).ravel())
+    return point_ids, faces, np.concatenate(cells)
@@ -7,9 +7,21 @@
 
 
 from . materials import *
+from . connectivity import *
 from mathutils import Euler
 import vtk
 import bmesh
+import numpy as np
+import time
+import re
+import math
+import os
+import threading
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from vtk.util.numpy_support import numpy_to_vtk
 
 
 # ---------------------------------------------------------------------------------
@@ -25,6 +37,40 @@ label_suffix = " Label "
 background_suffix = "Background"
 # Color legend background suffix
 contour_suffix = "Contour"
+# Polygon layer storing the vtk cell id of each face
+cell_id_layer = "BVTK Cell Id"
+# Vertex layer storing the vtk point id of each vertex
+point_id_layer = "BVTK Point Id"
+# Mesh custom property storing the topology fingerprint
+topology_key = "BVTK Topology"
+# Prefixes of the float layers storing point and cell data arrays
+point_data_prefix = "BVTK Point Data "
+cell_data_prefix = "BVTK Cell Data "
+# Suffix of the default glyph object of the instances output
+glyph_suffix = "Glyph"
+# Prefix of the color ramp images shared by materials and legends
+ramp_image_prefix = "BVTK Ramp "
+# Image property storing the hash of the color ramp rasterized in it
+ramp_hash_key = "BVTK Ramp Hash"
+# Subdirectory of the output directory holding the cached volume files,
+# the only ones evicted when the volume cache is full
+volume_cache_dir = "volume cache"
+
+
+# ---------------------------------------------------------------------------------
+#   Converted data cache
+# ---------------------------------------------------------------------------------
+BlockCache = {}  # object name -> (leaf mtime, conversion settings) of composite data blocks
+MeshDataCache = {}  # mesh name -> (vtk data last converted into the mesh, its data size)
+SliceCache = {}  # output name -> (normalized (nz, ny, nx) volume, grid, range) of slices outputs
+VolumeCache = {}  # volume key -> (file path, grid, crop ranges, raw dimensions) of written volumes
+ProbeCache = {}  # values key -> probed vtk data of the last probed volume
+RampLUTCache = {}  # (ramp hash, size) -> rgba lookup table sampled from the ramp
+LocatorCache = OrderedDict()  # geometry fingerprint -> static cell locator, oldest first
+# Maximum number of cell locators kept in the cache
+max_cached_locators = 4
+# Lock guarding the locator cache
+locator_lock = threading.Lock()
 
 
 # ---------------------------------------------------------------------------------
@@ -73,29 +119,75 @@ def apply_geometry_filter(data):
     return geom.GetOutput()
 
 
-def apply_colors(color_node, bm, me, data):
+def as_polydata(data):
+    """Return the given data if it's polygonal data, otherwise
+    convert it applying a geometry filter. Return None if the
+    data can't be converted.
+    """
+    if check_mesh_data(data) and hasattr(data, "GetPolys"):
+        return data
+    log.warning("Input data is not polygonal data: converting to geometry. The "
+                "process may take a while, consider adding a geometry filter in "
+                "the node tree to avoid repeating this process.", draw_win=False)
+    data = apply_geometry_filter(data)
+    if not check_mesh_data(data):
+        log.error("Data can't be converted to a suitable geometry.\n"
+                  "Try changing the output type.")
+        return None
+    return data
+
+
+def get_point_array(data, array_name, n_components=None):
+    """Return the point data array with the given name as a numpy
+    array, or None if the name is empty or the array is missing or
+    has a different number of components.
+    """
+    if not array_name:
+        return None
+    array = data.GetPointData().GetArray(array_name)
+    if not array:
+        log.warning("Point data array '{}' not found.".format(array_name))
+        return None
+    if n_components and array.GetNumberOfComponents() != n_components:
+        log.warning("Point data array '{}' has {} components, {} expected."
+                    .format(array_name, array.GetNumberOfComponents(), n_components))
+        return None
+    return vtk_to_numpy(array)
+
+
+def apply_colors(color_node, me, data, mat=None, array_name=None, material_name=None):
+    """Apply the material of the color node to the mesh and unwrap it
+    on the colored array. Meshes sharing the same colors (e.g. blocks
+    of a multi block data set) can reuse the material returned by the
+    first call, and look up the array by name instead of by index.
+    """
     if color_node.color_by:
         texture = color_node.get_texture()
         uv_map = default_uv_map
-
-        if color_node.texture_type == "IMAGE":
-            img = ramp_to_image(texture.color_ramp, name=texture.name + 'IMAGE')
-            image_material(me, me.name, img, reset=color_node.reset_materials)
+        reset = color_node.reset_materials
+        material_name = material_name or me.name
+
+        if mat:
+            if reset:
+                me.materials.clear()
+            apply_material(me, mat)
+        elif color_node.texture_type == "IMAGE":
+            img = shared_ramp_image(texture.color_ramp)
+            mat = image_material(me, material_name, img, reset=reset)
         elif color_node.texture_type == "BLEND":
-            blend_material(me, me.name, texture.color_ramp, texture, reset=color_node.reset_materials)
+            mat = blend_material(me, material_name, texture.color_ramp, texture, reset=reset)
 
         s_range = (color_node.range_min, color_node.range_max)
-        array, is_point_data = get_color_array(data, color_node)
-
-        if is_point_data:
-            point_unwrap(bm, array, s_range, uv_map)
-        else:
-            face_unwrap(bm, array, s_range, uv_map)
+        array, is_point_data = get_color_array(data, color_node, array_name)
+        mesh_unwrap(me, array, s_range, is_point_data, color_node.array_component, uv_map)
+    return mat
 
 
-def vtk_data_to_mesh(data, name, color_node=None, smooth=False):
+def vtk_data_to_bmesh(data, name, color_node=None, smooth=False):
     """Convert the given vtkdata creating or overwriting
-    a blender object named 'name'.
+    a blender object named 'name'. Elements are created one
+    by one through bmesh: this is the legacy conversion, much
+    slower than vtk_data_to_mesh on big data sets.
     """
     if not data:
         log.error("No data provided.")
@@ -111,6 +203,7 @@ def vtk_data_to_mesh(data, name, color_node=None, smooth=False):
                       "Try changing the output type.")
             return
 
+    start_time = time.perf_counter()
     me, ob = mesh_and_object(name)
     if me.is_editmode:
         bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
@@ -201,11 +294,221 @@ def vtk_data_to_mesh(data, name, color_node=None, smooth=False):
         for i in range(len(verts)):
             verts[i].normal = point_normals.GetTuple(i)
 
+    id_layer = bm.faces.layers.int.get(cell_id_layer)
+    if id_layer:
+        # Cell ids of a previous bulk conversion are not valid anymore
+        bm.faces.layers.int.remove(id_layer)
+
+    bm.to_mesh(me)
+
     if color_node:
-        apply_colors(color_node, bm, me, data)
+        apply_colors(color_node, me, data)
+
+    if topology_key in me:
+        # The topology may have changed without updating the fingerprint
+        del me[topology_key]
+    MeshDataCache[me.name] = data, data_size(data)
+    log.info('Blender mesh created! {} vertices in {:.2f} s.'
+             .format(len(verts), time.perf_counter() - start_time), draw_win=True)
 
+
+def clear_mesh(me):
+    """Remove all the geometry from the given mesh,
+    keeping the datablock and its materials.
+    """
+    bm = bmesh.new()
     bm.to_mesh(me)
-    log.info('Blender mesh created! {} vertices.'.format(len(verts)), draw_win=True)
+    bm.free()
+
+
+def numpy_to_mesh(me, verts, faces=None, edges=None, smooth=False, face_cells=None):
+    """Fill an empty mesh in bulk. Vertices are given as a (n, 3)
+    array, faces as an (offsets, counts, connectivity) tuple and
+    edges as a (m, 2) array of vertex indices. If face_cells is
+    provided, the vtk cell id of each face is stored in the mesh.
+    """
+    me.vertices.add(len(verts))
+    me.vertices.foreach_set("co", verts.astype(np.float32, copy=False).ravel())
+
+    if edges is not None and len(edges):
+        me.edges.add(len(edges))
+        me.edges.foreach_set("vertices", edges.astype(np.int32, copy=False).ravel())
+
+    if faces is not None and len(faces[1]):
+        offsets, counts, connectivity = faces
+        n_faces = len(counts)
+        me.loops.add(len(connectivity))
+        me.loops.foreach_set("vertex_index", connectivity.astype(np.int32, copy=False))
+        me.polygons.add(n_faces)
+        me.polygons.foreach_set("loop_start", offsets.astype(np.int32, copy=False))
+        me.polygons.foreach_set("loop_total", counts.astype(np.int32, copy=False))
+        me.polygons.foreach_set("use_smooth", np.full(n_faces, smooth, dtype=bool))
+        if face_cells is not None:
+            set_cell_ids(me, face_cells)
+
+    me.update(calc_edges=True)
+    # Remove degenerate faces (e.g. with repeated vertices),
+    # that bmesh used to reject one by one.
+    me.validate()
+
+
+def set_cell_ids(me, face_cells):
+    """Store the vtk cell id of each face in an integer
+    polygon layer, used to map cell data on the faces.
+    """
+    layer = me.polygon_layers_int.get(cell_id_layer)
+    if not layer:
+        layer = me.polygon_layers_int.new(cell_id_layer)
+    layer.data.foreach_set("value", face_cells.astype(np.int32, copy=False))
+
+
+def set_point_ids(me, point_ids):
+    """Store the vtk point id of each vertex in an integer vertex
+    layer, for meshes using only a subset of the points.
+    """
+    layer = me.vertex_layers_int.get(point_id_layer)
+    if not layer:
+        layer = me.vertex_layers_int.new(point_id_layer)
+    layer.data.foreach_set("value", point_ids.astype(np.int32, copy=False))
+
+
+def unit_vectors_np(vectors):
+    """Normalize the rows of a (n, 3) numpy array, leaving null
+    vectors untouched.
+    """
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1
+    return vectors / norms[:, None]
+
+
+def unit_vectors(array):
+    """Return the tuples of a 3 components vtk array
+    normalized, as a float32 (n, 3) numpy array.
+    """
+    vectors = vtk_to_numpy(array).astype(np.float32).reshape(-1, 3)
+    return unit_vectors_np(vectors)
+
+
+def set_custom_normals(me, data):
+    """Load the point or cell normals of the vtk data (e.g. generated
+    by vtkPolyDataNormals) as custom split normals of the mesh. Point
+    normals take precedence; cell normals are repeated for each loop
+    of the face. Auto smooth is enabled so that the custom normals are
+    used as they are. Return false if the data has no usable normals.
+    """
+    point_normals = data.GetPointData().GetNormals()
+    cell_normals = data.GetCellData().GetNormals()
+
+    if point_normals and point_normals.GetNumberOfTuples() != data.GetNumberOfPoints():
+        point_normals = None
+    if cell_normals and cell_normals.GetNumberOfTuples() != data.GetNumberOfCells():
+        cell_normals = None
+    if not (point_normals or cell_normals) or not len(me.polygons):
+        return False
+
+    # Custom normals are ignored on flat faces
+    me.polygons.foreach_set("use_smooth", np.ones(len(me.polygons), dtype=bool))
+    me.use_auto_smooth = True
+    me.auto_smooth_angle = math.pi
+
+    if point_normals:
+        me.normals_split_custom_set_from_vertices(unit_vectors(point_normals)[vertex_point_ids(me)])
+    else:
+        normals = unit_vectors(cell_normals)[face_cell_ids(me)]
+        me.normals_split_custom_set(loop_face_values(me, normals))
+    log.debug("Custom normals set from {} normals.".format("point" if point_normals else "cell"))
+    return True
+
+
+def vtk_data_to_mesh(data, name, color_node=None, smooth=False, store_arrays=False, array_names=(),
+                     k_slice=-1):
+    """Convert the given vtkdata creating or overwriting a blender
+    object named 'name'. Points and cells are read as numpy arrays
+    and loaded into the mesh in bulk, without per element calls.
+    Structured data sets are converted to their boundary surface,
+    or to the given k slice, directly from their dimensions.
+    If store_arrays is true the data arrays (all of them, or the
+    ones listed in array_names) are stored in the mesh.
+    """
+    if not data:
+        log.error("No data provided.")
+        return
+
+    structured = is_structured(data)
+    if not structured:
+        data = as_polydata(data)
+        if not data:
+            return
+
+    start_time = time.perf_counter()
+    me, ob = mesh_and_object(name)
+    if me.is_editmode:
+        bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
+
+    if structured:
+        fingerprint = "structured {} {}".format(tuple(data.GetDimensions()), k_slice)
+    else:
+        fingerprint = topology_fingerprint(data)
+    has_normals = bool(data.GetPointData().GetNormals() or data.GetCellData().GetNormals())
+    fingerprint = "{} {} {}".format(fingerprint, smooth, has_normals)
+
+    if me.get(topology_key) == fingerprint and points_in_range(me, data):
+        # Same topology as the last conversion (e.g. a new time step
+        # of the same simulation): only the coordinates are uploaded.
+        log.debug("Topology unchanged, updating vertex coordinates only.")
+        point_ids = vertex_point_ids(me)
+        if structured:
+            verts = structured_points(data, point_ids)
+        else:
+            verts = points_to_numpy(data)[point_ids]
+        me.vertices.foreach_set("co", verts.ravel())
+        me.update()
+    elif structured:
+        point_ids, faces, face_cells = structured_surface(data.GetDimensions(), k_slice)
+        clear_mesh(me)
+        me.use_auto_smooth = False
+        numpy_to_mesh(me, structured_points(data, point_ids), faces, None, smooth, face_cells)
+        set_point_ids(me, point_ids)
+        me[topology_key] = fingerprint
+    else:
+        cells = decode_polydata(data)
+        clear_mesh(me)
+        me.use_auto_smooth = False
+        numpy_to_mesh(me, points_to_numpy(data), cells.faces, cells.edges, smooth, cells.face_cells)
+        me[topology_key] = fingerprint
+
+    set_custom_normals(me, data)
+
+    if store_arrays:
+        store_data_arrays(me, data, array_names)
+
+    if color_node:
+        apply_colors(color_node, me, data)
+
+    MeshDataCache[me.name] = data, data_size(data)
+    log.info('Blender mesh created! {} vertices, {} faces in {:.2f} s.'
+             .format(len(me.vertices), len(me.polygons), time.perf_counter() - start_time),
+             draw_win=True)
+
+
+def refresh_mesh_colors(name, color_node):
+    """Recompute the colors (uv coordinates and material) of an
+    existing mesh from the data used to build it, without executing
+    the pipeline or converting the geometry again. Return False if
+    the mesh or its data are not available, or if the number of
+    points or cells of the data changed since the conversion.
+    """
+    me = bpy.data.meshes.get(name)
+    data, size = MeshDataCache.get(name, (None, None))
+    if not me or not data or not points_in_range(me, data):
+        return False
+    if data_size(data) != size:
+        # Modified in place: the cell ids of the faces may be wrong
+        return False
+    start_time = time.perf_counter()
+    apply_colors(color_node, me, data)
+    log.info("Colors refreshed in {:.2f} s.".format(time.perf_counter() - start_time))
+    return True
 
 
 def mesh_and_object(name):
@@ -254,13 +557,14 @@ def get_object(name, data):
 # ---------------------------------------------------------------------------------
 
 
-def get_color_array(data, color_node):
+def get_color_array(data, color_node, array_name=None):
     """Retrieve an array from the given data, based on the
     'color by' selection on the provided color node. If the
     color node is not valid then try to retrieve point data
-    scalars or face data scalars. Return a tuple with the
-    array and a boolean specifying whether it represents or
-    not point data."""
+    scalars or face data scalars. If an array name is given
+    it's used instead of the index of the selection. Return
+    a tuple with the array and a boolean specifying whether
+    it represents or not point data."""
     data_array = None
     is_pd = False
 
@@ -274,6 +578,10 @@ def get_color_array(data, color_node):
             elif fd and hasattr(fd, "GetScalars"):
                 data_array = fd.GetScalars()
                 is_pd = False
+    elif array_name:
+        is_pd = color_node.color_by[0] == 'P'
+        attributes = data.GetPointData() if is_pd else data.GetCellData()
+        data_array = attributes.GetArray(array_name)
     elif color_node.color_by[0] == 'P':
         data_array = data.GetPointData().GetArray(int(color_node.color_by[1:]))
         is_pd = True
@@ -284,22 +592,35 @@ def get_color_array(data, color_node):
     return data_array, is_pd
 
 
+def ramp_hash(ramp):
+    """Return a string identifying the colors of a color ramp:
+    interpolation, positions and rgba colors of its elements.
+    """
+    parts = [ramp.interpolation, ramp.color_mode, ramp.hue_interpolation]
+    parts.extend((e.position, tuple(e.color)) for e in ramp.elements)
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
 def ramp_to_image(ramp, name=None, image=None, w=2000, h=100):
     """Take a color ramp and create a blender image h pixel tall
-    and w pixels wide.
+    and w pixels wide. The image is rasterized and packed again
+    only if the ramp has changed since the last time.
     """
+    key = ramp_hash(ramp)
     if not image:
+        image = bpy.data.images.get(name)
+        if image and image.get(ramp_hash_key) == key and tuple(image.size) == (w, h):
+            return image
         image = get_image(name, (w, h))
     else:
         w = image.generated_width
         h = image.generated_height
+        if image.get(ramp_hash_key) == key:
+            return image
 
-    p = []
-    for y in range(h):
-        for x in range(w):
-            p.extend(ramp.evaluate(x / w))
-
-    image.pixels = p
+    # All the rows are equal
+    set_image_pixels(image, np.tile(ramp_lut(ramp, w), (h, 1)))
+    image[ramp_hash_key] = key
     # The image could be deleted automatically by blender
     # if it's not used, this must be prevented setting
     # 'use_fake_user' to true
@@ -310,36 +631,328 @@ def ramp_to_image(ramp, name=None, image=None, w=2000, h=100):
     return image
 
 
-def face_unwrap(bm, array, s_range, uv_layer_key=default_uv_map):
-    if array:
-        r_min, r_max = s_range
-        if r_max == r_min:
-            log.warning("Can't unwrap: constant range({}, {}).".format(r_min, r_max))
-            return bm
-        uv_layer = get_item(bm.loops.layers.uv, uv_layer_key)
-        bm.faces.index_update()
-        for face in bm.faces:
-            for loop in face.loops:
-                v = (array.GetValue(face.index) - r_min)/(r_max - r_min)
-                # Force value inside range.
-                v = min(0.999, max(0.001, v))
-                loop[uv_layer].uv = (v, 0.5)
-
-
-def point_unwrap(bm, array, s_range, uv_layer_key=default_uv_map):
-    if array:
-        r_min, r_max = s_range
-        if r_max == r_min:
-            log.warning("Can't unwrap: constant range({}, {}).".format(r_min, r_max))
-            return bm
-        uv_layer = get_item(bm.loops.layers.uv, uv_layer_key)
-        bm.verts.index_update()
-        for face in bm.faces:
-            for loop in face.loops:
-                v = (array.GetValue(loop.vert.index) - r_min)/(r_max - r_min)
-                # Force value inside range.
-                v = min(0.999, max(0.001, v))
-                loop[uv_layer].uv = (v, 0.5)
+def shared_ramp_image(ramp):
+    """Return the image of a color ramp, shared by all the materials
+    and legends using the same colors. Shared images of other ramps
+    which are no longer used are removed.
+    """
+    name = ramp_image_prefix + ramp_hash(ramp)[:12]
+    for image in [i for i in bpy.data.images if i.name.startswith(ramp_image_prefix)]:
+        # The fake user is the only user of unused images
+        if image.name != name and image.users <= 1:
+            bpy.data.images.remove(image)
+    return ramp_to_image(ramp, name)
+
+
+def ramp_lut(ramp, size=1024):
+    """Sample a color ramp into a (size, 4) float32 array of rgba
+    colors, evenly spaced from 0 to 1. Tables are cached by ramp
+    colors and size.
+    """
+    key = ramp_hash(ramp), size
+    if key not in RampLUTCache:
+        if len(RampLUTCache) > 32:
+            RampLUTCache.clear()
+        RampLUTCache[key] = np.array([ramp.evaluate(i / (size - 1)) for i in range(size)],
+                                     dtype=np.float32)
+    return RampLUTCache[key]
+
+
+def lut_colors(values, lut):
+    """Return the rgba colors of normalized values (clipped in
+    0 to 1) looked up in the given table.
+    """
+    indices = np.clip(values, 0, 1) * (len(lut) - 1) + 0.5
+    return lut[indices.astype(np.int32)]
+
+
+def set_image_pixels(image, pixels):
+    """Write an array of rgba values in the pixels of an image."""
+    pixels = np.ascontiguousarray(pixels, dtype=np.float32).ravel()
+    if hasattr(image.pixels, "foreach_set"):
+        image.pixels.foreach_set(pixels)
+    else:
+        # Lists are assigned much faster than numpy arrays
+        image.pixels[:] = pixels.tolist()
+
+
+def array_values(array, component=-1):
+    """Return the values of a vtk array as a numpy array. Multi
+    component arrays are reduced to the magnitude of each tuple or,
+    if a valid component index is given, to that component.
+    """
+    values = vtk_to_numpy(array)
+    if values.ndim > 1:
+        if 0 <= component < values.shape[1]:
+            values = values[:, component]
+        else:
+            values = np.linalg.norm(values, axis=1)
+    return values
+
+
+def loop_vertex_indices(me):
+    """Return the vertex index of each loop of the mesh."""
+    indices = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("vertex_index", indices)
+    return indices
+
+
+def loop_face_values(me, face_values):
+    """Repeat the given per face values (scalars or tuples)
+    for each loop of the face.
+    """
+    n_faces = len(me.polygons)
+    starts = np.empty(n_faces, dtype=np.int32)
+    totals = np.empty(n_faces, dtype=np.int32)
+    me.polygons.foreach_get("loop_start", starts)
+    me.polygons.foreach_get("loop_total", totals)
+    # Position of each loop relative to the first one of its face
+    local = np.arange(totals.sum()) - np.repeat(np.cumsum(totals) - totals, totals)
+    values = np.empty((len(me.loops),) + face_values.shape[1:], dtype=face_values.dtype)
+    values[np.repeat(starts, totals) + local] = np.repeat(face_values, totals, axis=0)
+    return values
+
+
+def face_cell_ids(me):
+    """Return the vtk cell id of each face. Faces may not follow the
+    vtk cells order: meshes built in bulk store the cell id of each
+    face, otherwise the face index is used.
+    """
+    layer = me.polygon_layers_int.get(cell_id_layer)
+    if not layer:
+        return np.arange(len(me.polygons))
+    cell_ids = np.empty(len(me.polygons), dtype=np.int32)
+    layer.data.foreach_get("value", cell_ids)
+    return cell_ids
+
+
+def vertex_point_ids(me):
+    """Return the vtk point id of each vertex. Meshes using only part
+    of the points (e.g. structured grid surfaces) store the point id
+    of each vertex, otherwise the vertex index is used.
+    """
+    layer = me.vertex_layers_int.get(point_id_layer)
+    if not layer:
+        return np.arange(len(me.vertices))
+    point_ids = np.empty(len(me.vertices), dtype=np.int32)
+    layer.data.foreach_get("value", point_ids)
+    return point_ids
+
+
+def data_size(data):
+    """Return the number of points and cells of the given vtk data."""
+    return data.GetNumberOfPoints(), data.GetNumberOfCells()
+
+
+def points_in_range(me, data):
+    """Return true if every vertex of the mesh refers to
+    a point of the given vtk data.
+    """
+    point_ids = vertex_point_ids(me)
+    return bool(len(point_ids)) and point_ids.max() < data.GetNumberOfPoints()
+
+
+def get_uv_layer(me, uv_layer_key=default_uv_map):
+    """Get or create the uv layer with the given name."""
+    if uv_layer_key not in me.uv_layers:
+        me.uv_textures.new(uv_layer_key)
+    return me.uv_layers[uv_layer_key]
+
+
+def mesh_unwrap(me, array, s_range, is_point_data, component=-1, uv_layer_key=default_uv_map):
+    """Unwrap the mesh on the u axis based on the array values: point
+    data are gathered through the vertex index of each loop, cell data
+    repeated for each loop of the face. All loops are computed at once
+    and written with a single foreach_set.
+    """
+    if not array:
+        return
+    values = array_values(array, component)
+    if is_point_data:
+        values = values[vertex_point_ids(me)]
+    else:
+        values = values[face_cell_ids(me)]
+    unwrap_values(me, values, s_range, is_point_data, uv_layer_key)
+
+
+def unwrap_values(me, values, s_range, is_point_data, uv_layer_key=default_uv_map):
+    """Unwrap the mesh based on a numpy array with a value for
+    each vertex (point data) or for each face (cell data).
+    """
+    r_min, r_max = s_range
+    if r_max == r_min:
+        log.warning("Can't unwrap: constant range({}, {}).".format(r_min, r_max))
+        return
+
+    if is_point_data:
+        values = values[loop_vertex_indices(me)]
+    else:
+        values = loop_face_values(me, values)
+
+    uv = np.full((len(values), 2), 0.5, dtype=np.float32)
+    uv[:, 0] = (values - r_min) / (r_max - r_min)
+    # Force values inside range.
+    np.clip(uv[:, 0], 0.001, 0.999, out=uv[:, 0])
+    get_uv_layer(me, uv_layer_key).data.foreach_set("uv", uv.ravel())
+
+
+# ---------------------------------------------------------------------------------
+#   Data arrays stored in the mesh
+# ---------------------------------------------------------------------------------
+
+
+def data_layers(me, is_point_data):
+    """Return the float layers of the mesh storing point or cell data."""
+    if is_point_data:
+        return me.vertex_layers_float, point_data_prefix
+    return me.polygon_layers_float, cell_data_prefix
+
+
+def data_layer_name(array_name, component, n_components, is_point_data):
+    prefix = point_data_prefix if is_point_data else cell_data_prefix
+    if n_components == 1:
+        return prefix + array_name
+    return "{}{}[{}]".format(prefix, array_name, component)
+
+
+def store_data_arrays(me, data, array_names=(), point_ids=None, point_only=False):
+    """Store the point and cell data arrays of the given vtk data in
+    float layers of the mesh (one for each component), so that they
+    can be displayed later without converting the data again. If a
+    list of array names is given only those arrays are stored. If
+    the vertices are a subset of the points, their ids must be given
+    in point_ids. Cell data are not stored if point_only is set (the
+    mesh has no faces) or point_ids is given. Layers of arrays that
+    are not stored anymore are removed.
+    """
+    stored = 0
+    layer_names = set()
+    attributes_list = [(data.GetPointData(), True)]
+    if point_ids is None and not point_only:
+        attributes_list.append((data.GetCellData(), False))
+
+    for attributes, is_point_data in attributes_list:
+        layers = data_layers(me, is_point_data)[0]
+        if is_point_data:
+            ids = vertex_point_ids(me) if point_ids is None else point_ids
+        else:
+            ids = face_cell_ids(me)
+
+        for i in range(attributes.GetNumberOfArrays()):
+            array = attributes.GetArray(i)
+            # Non numeric arrays (e.g. strings) can't be stored
+            if not array or (array_names and array.GetName() not in array_names):
+                continue
+
+            values = vtk_to_numpy(array).reshape(array.GetNumberOfTuples(), -1)
+            if ids is not None:
+                values = values[ids]
+            n_components = values.shape[1]
+
+            for c in range(n_components):
+                layer_name = data_layer_name(str(array.GetName()), c, n_components, is_point_data)
+                layer = layers.get(layer_name)
+                if not layer:
+                    layer = layers.new(layer_name)
+                layer.data.foreach_set("value", values[:, c].astype(np.float32))
+                layer_names.add(layer_name)
+            stored += 1
+
+    remove_data_layers(me, layer_names)
+    log.info("{} data arrays stored in the mesh.".format(stored))
+
+
+def remove_data_layers(me, keep=()):
+    """Remove the data array layers of the mesh whose name is not in keep."""
+    stale = []
+    for is_point_data in (True, False):
+        layers, prefix = data_layers(me, is_point_data)
+        stale += [layer.name for layer in layers
+                  if layer.name.startswith(prefix) and layer.name not in keep]
+    if not stale:
+        return
+    # Mesh float layers can't be removed with the mesh api
+    bm = bmesh.new()
+    bm.from_mesh(me)
+    for seq in (bm.verts, bm.faces):
+        for layer_name in stale:
+            layer = seq.layers.float.get(layer_name)
+            if layer:
+                seq.layers.float.remove(layer)
+    bm.to_mesh(me)
+    bm.free()
+
+
+def stored_arrays(me):
+    """Return a list of (array name, is point data, number of components)
+    tuples describing the data arrays stored in the mesh.
+    """
+    arrays = []
+    for is_point_data in (True, False):
+        layers, prefix = data_layers(me, is_point_data)
+        components = {}
+        for layer in layers:
+            if not layer.name.startswith(prefix):
+                continue
+            name = layer.name[len(prefix):]
+            match = re.match(r"^(.*)\[(\d+)\]$", name)
+            if match:
+                name = match.group(1)
+            components[name] = components.get(name, 0) + 1
+        for name in sorted(components):
+            arrays.append((name, is_point_data, components[name]))
+    return arrays
+
+
+def stored_array_values(me, array_name, is_point_data, component=-1):
+    """Read a data array stored in the mesh. Multi component arrays
+    are reduced to the magnitude, unless a valid component is given.
+    Return None if the array is not stored in the mesh.
+    """
+    layers = data_layers(me, is_point_data)[0]
+    size = len(me.vertices) if is_point_data else len(me.polygons)
+
+    def read(layer_name):
+        values = np.empty(size, dtype=np.float32)
+        layers[layer_name].data.foreach_get("value", values)
+        return values
+
+    single_name = data_layer_name(array_name, 0, 1, is_point_data)
+    if single_name in layers:
+        return read(single_name)
+
+    columns = []
+    while True:
+        layer_name = data_layer_name(array_name, len(columns), 2, is_point_data)
+        if layer_name not in layers:
+            break
+        columns.append(read(layer_name))
+
+    if not columns:
+        return None
+    if 0 <= component < len(columns):
+        return columns[component]
+    return np.linalg.norm(np.column_stack(columns), axis=1)
+
+
+def show_stored_array(me, array_name, is_point_data, color_node=None):
+    """Color the mesh with a data array stored in the mesh itself,
+    without accessing the vtk data. The range of the color node is
+    used, unless it's set to automatic.
+    """
+    component = color_node.array_component if color_node else -1
+    values = stored_array_values(me, array_name, is_point_data, component)
+
+    if values is None:
+        log.error("Array '{}' is not stored in the mesh '{}'.".format(array_name, me.name))
+        return
+
+    if color_node and not color_node.auto_range:
+        s_range = color_node.range_min, color_node.range_max
+    else:
+        s_range = float(values.min()), float(values.max())
+
+    unwrap_values(me, values, s_range, is_point_data)
 
 
 # ---------------------------------------------------------------------------------
@@ -428,7 +1041,7 @@ def create_color_legend(name, color_node, n_div, font="", w=0.5, h=5.5, fontsize
                   "color legend.")
         return
 
-    img = ramp_to_image(tex.color_ramp, cl_name)
+    img = shared_ramp_image(tex.color_ramp)
     image_material(me, color_leg_mat_prefix+name, img)
     r_min, r_max = color_node.range_min, color_node.range_max
 
@@ -436,7 +1049,6 @@ def create_color_legend(name, color_node, n_div, font="", w=0.5, h=5.5, fontsize
         log.error("Range maximum greater than minimum.")
         return
 
-    import math
     ideal_space = (r_max-r_min)/n_div
     exponent = math.floor(math.log10(ideal_space))
     mantissa = ideal_space/(10**exponent)
@@ -519,6 +1131,380 @@ def create_color_legend(name, color_node, n_div, font="", w=0.5, h=5.5, fontsize
     solid_material(rect_c_curve, color_leg_mat_prefix+name+" "+contour_suffix, (0.013, 0.013, 0.013))
 
 
+# ---------------------------------------------------------------------------------
+#   Composite data conversion
+# ---------------------------------------------------------------------------------
+
+
+def is_composite(data):
+    """Return true if the data is a composite data set
+    (e.g. vtkMultiBlockDataSet).
+    """
+    return hasattr(data, "IsA") and data.IsA("vtkCompositeDataSet")
+
+
+def composite_leaves(data, path=""):
+    """Yield a (path, name, leaf) tuple for each non empty leaf of a
+    composite data set. The path is made of the block indices, the
+    name is read from the block metadata (or empty).
+    """
+    if hasattr(data, "GetNumberOfBlocks"):
+        n_blocks, get_block = data.GetNumberOfBlocks(), data.GetBlock
+    else:
+        n_blocks, get_block = data.GetNumberOfPieces(), data.GetPiece
+
+    for i in range(n_blocks):
+        block = get_block(i)
+        if not block:
+            continue
+        block_path = path + str(i)
+        block_name = ""
+        if hasattr(data, "HasMetaData") and data.HasMetaData(i):
+            block_name = data.GetMetaData(i).Get(vtk.vtkCompositeDataSet.NAME()) or ""
+        if is_composite(block):
+            yield from composite_leaves(block, block_path + ".")
+        else:
+            yield block_path, block_name, block
+
+
+def get_empty(name):
+    """Get or create an empty object and link it to the scene."""
+    ob = bpy.data.objects.get(name)
+    if ob and ob.type != "EMPTY":
+        bpy.data.objects.remove(ob, do_unlink=True)
+        ob = None
+    if not ob:
+        ob = bpy.data.objects.new(name, None)
+    set_link(bpy.context.scene.objects, ob)
+    return ob
+
+
+def vtk_data_to_blocks(data, name, color_node=None, smooth=False, k_slice=-1, mesh_engine="BULK",
+                       store_arrays=False, array_names=()):
+    """Convert each leaf of a composite data set into its own mesh
+    object, parented to an empty named 'name', with the same options
+    of a single data set (see vtk_data_to_mesh and vtk_data_to_bmesh,
+    selected by mesh_engine). Objects are named after the block path
+    and metadata name. Leaves not modified since the last conversion
+    are not converted again, and all the blocks share the same material.
+    """
+    if not data:
+        log.error("No data provided.")
+        return
+
+    start_time = time.perf_counter()
+    parent = get_empty(name)
+    leaves = list(composite_leaves(data))
+    if not leaves:
+        log.warning("The composite data set has no blocks to convert.")
+
+    array_name = None
+    if color_node and color_node.color_by and leaves:
+        # The arrays listed by the color node are the ones of the first leaf
+        array = get_color_array(leaves[0][2], color_node)[0]
+        array_name = array.GetName() if array else None
+
+    names = set()
+    converted = 0
+    mat = None
+    log.disable_draw_win()
+    try:
+        for path, block_name, leaf in leaves:
+            # Blender truncates object names to 63 characters
+            ob_name = " ".join(part for part in (name, path, block_name) if part)[:63]
+            names.add(ob_name)
+            key = (leaf.GetMTime(), smooth, k_slice, mesh_engine, store_arrays, tuple(array_names))
+
+            if ob_name not in bpy.data.objects or BlockCache.get(ob_name) != key:
+                if mesh_engine == "BMESH":
+                    vtk_data_to_bmesh(leaf, ob_name, smooth=smooth)
+                else:
+                    vtk_data_to_mesh(leaf, ob_name, smooth=smooth, store_arrays=store_arrays,
+                                     array_names=array_names, k_slice=k_slice)
+                BlockCache[ob_name] = key
+                converted += 1
+            ob = bpy.data.objects.get(ob_name)
+            if not ob or ob.type != "MESH":
+                continue
+
+            ob.parent = parent
+            if array_name:
+                mat = apply_colors(color_node, ob.data, leaf, mat, array_name, name)
+    finally:
+        log.enable_draw_win()
+
+    # Remove the objects of blocks no longer in the data
+    for child in parent.children:
+        if child.name not in names and child.name.startswith(name + " "):
+            BlockCache.pop(child.name, None)
+            bpy.data.objects.remove(child, do_unlink=True)
+
+    log.info('{} blocks converted, {} unchanged, in {:.2f} s.'
+             .format(converted, len(leaves) - converted, time.perf_counter() - start_time),
+             draw_win=True)
+
+
+# ---------------------------------------------------------------------------------
+#   Point cloud conversion
+# ---------------------------------------------------------------------------------
+
+
+def sample_points(n_points, max_points=0, sampling="STRIDE"):
+    """Return the ids of the points to keep to stay within the given
+    budget (0 means no limit), or None if all the points are kept.
+    Random sampling uses a fixed seed so that consecutive updates
+    select the same points.
+    """
+    if not max_points or n_points <= max_points:
+        return None
+    if sampling == "RANDOM":
+        ids = np.random.RandomState(0).choice(n_points, max_points, replace=False)
+        ids.sort()
+        return ids
+    stride = -(-n_points // max_points)  # Ceil division
+    return np.arange(0, n_points, stride, dtype=np.int64)
+
+
+def vtk_data_to_points(data, name, max_points=0, sampling="STRIDE", store_arrays=False,
+                       array_names=()):
+    """Convert the points of the given vtk data into the vertices of a
+    mesh named 'name', without decoding any cell. If store_arrays is
+    true, point data arrays (all of them, or the ones listed in
+    array_names) are stored as vertex layers. Large clouds can be
+    subsampled to max_points points, taking one point every n or
+    picking them at random.
+    """
+    if not data:
+        log.error("No data provided.")
+        return
+
+    if not hasattr(data, "GetPoints"):
+        data = as_polydata(data)
+        if not data:
+            return
+
+    start_time = time.perf_counter()
+    me, ob = mesh_and_object(name)
+    if me.is_editmode:
+        bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
+
+    verts = points_to_numpy(data)
+    point_ids = sample_points(len(verts), max_points, sampling)
+    if point_ids is not None:
+        verts = verts[point_ids]
+
+    fingerprint = "points {} {} {}".format(data.GetNumberOfPoints(), max_points, sampling)
+    if me.get(topology_key) == fingerprint and len(me.vertices) == len(verts):
+        me.vertices.foreach_set("co", verts.ravel())
+        me.update()
+    else:
+        clear_mesh(me)
+        numpy_to_mesh(me, verts)
+        me[topology_key] = fingerprint
+
+    if store_arrays:
+        store_data_arrays(me, data, array_names, point_ids, point_only=True)
+    else:
+        remove_data_layers(me)
+    MeshDataCache.pop(me.name, None)
+    log.info('Blender point cloud created! {} of {} points in {:.2f} s.'
+             .format(len(verts), data.GetNumberOfPoints(), time.perf_counter() - start_time),
+             draw_win=True)
+
+
+# ---------------------------------------------------------------------------------
+#   Glyph instances conversion
+# ---------------------------------------------------------------------------------
+
+
+def default_glyph(name):
+    """Create (or get) a mesh object with an arrow pointing
+    along the z axis, to be used as default glyph.
+    """
+    if name in bpy.data.objects:
+        return bpy.data.objects[name]
+    arrow = vtk.vtkArrowSource()
+    # The arrow source points along x, instances are aligned to z
+    transform = vtk.vtkTransform()
+    transform.RotateY(-90)
+    transform_filter = vtk.vtkTransformPolyDataFilter()
+    transform_filter.SetTransform(transform)
+    transform_filter.SetInputConnection(arrow.GetOutputPort())
+    transform_filter.Update()
+    vtk_data_to_mesh(transform_filter.GetOutput(), name, smooth=True)
+    return bpy.data.objects[name]
+
+
+def instance_faces(centers, directions, scales):
+    """Build a triangle for each center, with its normal along the
+    given direction and an area equal to the square of the given
+    scale, as required by blender face duplication.
+    Return the (3n, 3) vertices of the triangles.
+    """
+    n = unit_vectors_np(directions)
+    # Any axis not parallel to the direction completes the frame
+    axis = np.zeros_like(n)
+    parallel = np.abs(n[:, 0]) > 0.9
+    axis[~parallel, 0] = 1
+    axis[parallel, 1] = 1
+    u = unit_vectors_np(np.cross(n, axis))
+    w = np.cross(n, u)
+    # Right isosceles triangle with legs l: area = l^2 / 2
+    legs = (scales * np.sqrt(2))[:, None]
+    first = centers - (u + w) * legs / 3
+    verts = np.stack((first, first + u * legs, first + w * legs), axis=1)
+    return verts.reshape(-1, 3).astype(np.float32)
+
+
+def vtk_data_to_instances(data, name, vector_array="", scale_array="", scale_factor=1.0,
+                          glyph_name="", max_points=0, sampling="STRIDE"):
+    """Display a glyph for each point of the given vtk data using
+    blender face duplication: a small triangle is created for each
+    point, oriented along the vector array and sized by the scale
+    array, and the glyph object is instanced on every triangle. The
+    glyph object must point along its z axis; if no glyph is given a
+    default arrow is created.
+    """
+    if not data:
+        log.error("No data provided.")
+        return
+
+    if not hasattr(data, "GetPoints"):
+        data = as_polydata(data)
+        if not data:
+            return
+
+    start_time = time.perf_counter()
+    me, ob = mesh_and_object(name)
+    if me.is_editmode:
+        bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
+
+    centers = points_to_numpy(data)
+    point_ids = sample_points(len(centers), max_points, sampling)
+    if point_ids is None:
+        point_ids = np.arange(len(centers))
+    centers = centers[point_ids]
+
+    directions = get_point_array(data, vector_array, 3)
+    if directions is None:
+        directions = np.tile(np.array([0, 0, 1], dtype=np.float32), (len(centers), 1))
+    else:
+        directions = directions[point_ids]
+    scales = get_point_array(data, scale_array, 1)
+    scales = np.ones(len(centers)) if scales is None else np.abs(scales[point_ids])
+    scales = scales * scale_factor
+
+    verts = instance_faces(centers, directions, scales)
+    fingerprint = "instances {} {} {}".format(data.GetNumberOfPoints(), max_points, sampling)
+    if me.get(topology_key) == fingerprint and len(me.vertices) == len(verts):
+        me.vertices.foreach_set("co", verts.ravel())
+        me.update()
+    else:
+        n = len(centers)
+        faces = (np.arange(0, 3*n, 3), np.full(n, 3), np.arange(3*n))
+        clear_mesh(me)
+        numpy_to_mesh(me, verts, faces)
+        me[topology_key] = fingerprint
+
+    ob.dupli_type = "FACES"
+    ob.use_dupli_faces_scale = True
+    ob.dupli_faces_scale = 1.0
+
+    glyph = bpy.data.objects.get(glyph_name) if glyph_name else None
+    if not glyph:
+        if glyph_name:
+            log.warning("Glyph object '{}' not found, using the default arrow.".format(glyph_name))
+        glyph = default_glyph(name + " " + glyph_suffix)
+    if glyph == ob:
+        log.error("The glyph object can't be the output object.")
+        return
+
+    # Every child is instanced: release the glyphs used before
+    for child in ob.children:
+        if child != glyph:
+            matrix = child.matrix_world.copy()
+            child.parent = None
+            child.matrix_world = matrix
+    arrow = bpy.data.objects.get(name + " " + glyph_suffix)
+    if arrow and arrow != glyph:
+        arrow_mesh = arrow.data
+        bpy.data.objects.remove(arrow, do_unlink=True)
+        if arrow_mesh and not arrow_mesh.users:
+            MeshDataCache.pop(arrow_mesh.name, None)
+            bpy.data.meshes.remove(arrow_mesh)
+    glyph.parent = ob
+
+    MeshDataCache.pop(me.name, None)
+    log.info('Blender glyph instances created! {} instances in {:.2f} s.'
+             .format(len(centers), time.perf_counter() - start_time), draw_win=True)
+
+
+# ---------------------------------------------------------------------------------
+#   Polylines conversion
+# ---------------------------------------------------------------------------------
+
+
+def vtk_data_to_curve(data, name, radius_array="", tilt_array="", radius_scale=1.0,
+                      bevel_depth=0.0, bevel_resolution=4):
+    """Convert the lines of the given vtk data (e.g. the output of a
+    stream tracer) into the poly splines of a blender curve named
+    'name'. Radius and tilt of each point are read from the given
+    point data arrays, so that tubes can be generated by bevelling
+    the curve instead of generating the geometry in vtk.
+    """
+    if not data:
+        log.error("No data provided.")
+        return
+
+    data = as_polydata(data)
+    if not data:
+        return
+
+    start_time = time.perf_counter()
+    offsets, counts, connectivity = cell_array_to_numpy(data.GetLines())
+    if not len(counts):
+        log.warning("The input data has no lines to convert.")
+
+    cur, ob = curve_and_object(name, "CURVE")
+    cur.dimensions = "3D"
+    cur.fill_mode = "FULL"
+    cur.bevel_depth = bevel_depth
+    cur.bevel_resolution = bevel_resolution
+
+    coords = np.ones((len(connectivity), 4), dtype=np.float32)
+    coords[:, :3] = points_to_numpy(data)[connectivity]
+
+    fingerprint = cell_array_checksum(data.GetLines())
+    if cur.get(topology_key) != fingerprint or len(cur.splines) != len(counts):
+        cur.splines.clear()
+        for count in counts:
+            spline = cur.splines.new("POLY")
+            spline.points.add(count - 1)  # A new spline has one point
+        cur[topology_key] = fingerprint
+
+    # Splines kept from the last conversion are reset to the
+    # default radius and tilt when no array is given.
+    radius = get_point_array(data, radius_array, 1)
+    radius = np.ones(len(connectivity)) if radius is None else radius[connectivity]
+    radius = (radius * radius_scale).astype(np.float32)
+    tilt = get_point_array(data, tilt_array, 1)
+    tilt = np.zeros(len(connectivity)) if tilt is None else tilt[connectivity]
+    tilt = tilt.astype(np.float32)
+
+    # Splines can't be created in bulk, but each one
+    # receives all its points with a single call.
+    for spline, start, count in zip(cur.splines, offsets, counts):
+        end = start + count
+        spline.points.foreach_set("co", coords[start:end].ravel())
+        spline.points.foreach_set("radius", radius[start:end])
+        spline.points.foreach_set("tilt", tilt[start:end])
+
+    cur.update_tag()
+    log.info('Blender curve created! {} splines, {} points in {:.2f} s.'
+             .format(len(counts), len(connectivity), time.perf_counter() - start_time),
+             draw_win=True)
+
+
 # ---------------------------------------------------------------------------------
 #  Text data conversion
 # ---------------------------------------------------------------------------------
@@ -536,6 +1522,73 @@ def vtk_data_to_text(data, name):
     log.info("Text created: '{}'.".format(data), draw_win=True)
 
 
+# ---------------------------------------------------------------------------------
+#   Cell locators
+# ---------------------------------------------------------------------------------
+
+
+def static_cell_locator(data):
+    """Return a static cell locator built on the geometry of the given
+    data, reusing the cached one if a data set with the same geometry
+    has already been probed. Return None if the data has no explicit
+    geometry or the locator is not available in this vtk version.
+    """
+    if not hasattr(vtk, "vtkStaticCellLocator"):
+        return None
+    fingerprint = geometry_fingerprint(data)
+    if not fingerprint:
+        return None
+
+    with locator_lock:
+        locator = LocatorCache.get(fingerprint)
+        if not locator:
+            start_time = time.perf_counter()
+            locator = vtk.vtkStaticCellLocator()
+            locator.SetDataSet(data)
+            locator.BuildLocator()
+            log.debug("Cell locator built in {:.2f} s.".format(time.perf_counter() - start_time))
+            LocatorCache[fingerprint] = locator
+            while len(LocatorCache) > max_cached_locators:
+                LocatorCache.popitem(last=False)
+        else:
+            log.debug("Reusing the cached cell locator.")
+            LocatorCache.move_to_end(fingerprint)
+        if hasattr(locator, "SetUseExistingSearchStructure"):
+            # Keep the search structure when the locator is moved
+            # to a new data set with the same geometry
+            locator.SetUseExistingSearchStructure(True)
+        locator.SetDataSet(data)
+    return locator
+
+
+def set_probe_locator(probe, source):
+    """Make the given probe filter find the cells of the source through
+    its cached static cell locator. Return True if the cached locator
+    is used, False if the probe builds its own.
+    """
+    locator = static_cell_locator(source)
+    if not locator:
+        return False
+    return use_cell_locator(probe, locator)
+
+
+def use_cell_locator(probe, locator):
+    """Make the given probe filter find cells through the given,
+    already built, cell locator. Return True if the locator is used,
+    False if the probe builds its own.
+    """
+    if hasattr(probe, "SetFindCellStrategy") and hasattr(vtk, "vtkCellLocatorStrategy"):
+        strategy = vtk.vtkCellLocatorStrategy()
+        strategy.SetCellLocator(locator)
+        probe.SetFindCellStrategy(strategy)
+        return True
+    if hasattr(probe, "SetCellLocatorPrototype"):
+        # Older vtk versions only take a prototype: the locator
+        # type is static, but the probe builds it again
+        probe.SetCellLocatorPrototype(locator)
+    return False
+
+
 # ---------------------------------------------------------------------------------
 #  Volume data conversion
 # ---------------------------------------------------------------------------------
@@ -637,7 +1690,66 @@ def scan_rect_grid(grid, non_uniform_warning="", exclude=()):
     return reverse_coords, uniformity
 
 
-def probe_grid(data, resolution=(250, 250, 250)):
+def probe_source(data, array_name=None):
+    """Return a shallow copy of the data to probe, keeping only the
+    point or cell data array with the given name (all of them if it's
+    None), so that the probe interpolates only what's needed.
+    """
+    source = data.NewInstance()
+    source.ShallowCopy(data)
+    if array_name:
+        for attributes in (source.GetPointData(), source.GetCellData()):
+            names = [attributes.GetArrayName(i) for i in range(attributes.GetNumberOfArrays())]
+            for name in names:
+                if name != array_name:
+                    attributes.RemoveArray(name)
+    return source
+
+
+def probe_slab(source, origin, spacing, dim, z_range, locator=None):
+    """Probe the source on the z layers z_range of the grid with the
+    given origin, spacing and dimensions, finding the source cells
+    through the given locator if any. Return the probe output.
+    """
+    z0, z1 = z_range
+    struct_p = vtk.vtkStructuredPoints()
+    struct_p.SetOrigin(origin[0], origin[1], origin[2] + z0 * spacing[2])
+    struct_p.SetDimensions(dim[0], dim[1], z1 - z0)
+    struct_p.SetSpacing(spacing)
+
+    probe = vtk.vtkProbeFilter()
+    probe.SetInputData(struct_p)
+    probe.SetSourceData(source)
+    if locator:
+        use_cell_locator(probe, locator)
+    probe.Update()
+    return probe.GetOutput()
+
+
+def probe_slab_layers(source, nx, ny, nz, workers):
+    """Return how many z layers to probe in each slab, so that the
+    slabs probed at the same time fit in the memory budget set in
+    the add-on preferences, and each worker gets a few of them.
+    """
+    # Bytes of each probed point: the interpolated arrays (at most
+    # double precision) and the valid point mask
+    n_components = 0
+    for attributes in (source.GetPointData(), source.GetCellData()):
+        for i in range(attributes.GetNumberOfArrays()):
+            n_components += attributes.GetArray(i).GetNumberOfComponents()
+    point_size = 8 * n_components + 1
+    budget = (get_addon_pref("probe_memory") or 1024) * 1024 * 1024
+    layers = max(1, budget // (workers * nx * ny * point_size))
+    return max(1, min(layers, -(-nz // (workers * 4))))
+
+
+def probe_grid(data, resolution=(250, 250, 250), array_name=None, progress=None):
+    """Probe the data on a regular grid with the given resolution. The
+    grid is split in z slabs, probed concurrently by a pool of threads
+    and stitched back into a single vtkStructuredPoints. If array_name
+    is given only that array is probed. The progress function, if
+    given, is called with (probed slabs, total slabs) after each slab.
+    """
     x0, x1, y0, y1, z0, z1 = data.GetBounds()
 
     if hasattr(data, "GetDimensions"):
@@ -647,127 +1759,566 @@ def probe_grid(data, resolution=(250, 250, 250)):
     else:
         nx, ny, nz = resolution
 
-    struct_p = vtk.vtkStructuredPoints()
-    struct_p.SetOrigin(x0, y0, z0)
+    origin = (x0, y0, z0)
+    spacing = ((x1 - x0) / nx, (y1 - y0) / ny, (z1 - z0) / nz)
+    source = probe_source(data, array_name)
+    workers = get_addon_pref("probe_threads") or os.cpu_count() or 1
+    layers = probe_slab_layers(source, nx, ny, nz, workers)
+    slabs = [(k, min(k + layers, nz)) for k in range(0, nz, layers)]
+
+    bar = None
+    if not progress:
+        bar = ChargingBar("Probing", max=len(slabs))
+        progress = lambda done, total: bar.next()
+
+    log.warning("Starting probe of {} slabs on {} threads. The process may take a long time."
+                .format(len(slabs), workers), draw_win=False)
+    start_time = time.perf_counter()
+    layer_size = nx * ny
+    arrays = {}
+
+    def stitch(z_range, slab):
+        # Copy the slab arrays into the full grid arrays, allocating
+        # them when the first slab is stitched
+        point_data = slab.GetPointData()
+        for i in range(point_data.GetNumberOfArrays()):
+            values = vtk_to_numpy(point_data.GetArray(i)).reshape(slab.GetNumberOfPoints(), -1)
+            name = point_data.GetArrayName(i)
+            if name not in arrays:
+                arrays[name] = np.empty((nx * ny * nz, values.shape[1]), dtype=values.dtype)
+            arrays[name][z_range[0] * layer_size:z_range[1] * layer_size] = values
+
+    # The locator is resolved once and shared by all the slabs. The
+    # first slab is probed here, so that the search structures the
+    # source builds lazily are ready before the threads share it
+    locator = static_cell_locator(source)
+    stitch(slabs[0], probe_slab(source, origin, spacing, (nx, ny, nz), slabs[0], locator))
+    progress(1, len(slabs))
+
+    # At most one slab per worker is in flight, as assumed by
+    # probe_slab_layers, and each one is released once stitched
+    pending = iter(slabs[1:])
+    futures = {}
+    done = 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def submit(z_range):
+            future = executor.submit(probe_slab, source, origin, spacing, (nx, ny, nz), z_range, locator)
+            futures[future] = z_range
+
+        for z_range in islice(pending, workers):
+            submit(z_range)
+        while futures:
+            for future in wait(futures, return_when=FIRST_COMPLETED)[0]:
+                stitch(futures.pop(future), future.result())
+                done += 1
+                progress(done, len(slabs))
+                z_range = next(pending, None)
+                if z_range:
+                    submit(z_range)
+            future = None  # The last stitched slab is not kept alive
+
+    if bar:
+        bar.finish()
+    log.warning("Probe complete in {:.2f} s.".format(time.perf_counter() - start_time), draw_win=False)
+
+    probe_out = vtk.vtkStructuredPoints()
+    probe_out.SetOrigin(origin)
+    probe_out.SetDimensions(nx, ny, nz)
+    probe_out.SetSpacing(spacing)
+    for name, values in arrays.items():
+        array = numpy_to_vtk(values.squeeze(axis=1) if values.shape[1] == 1 else values)
+        array.SetName(name)
+        probe_out.GetPointData().AddArray(array)
+    return probe_out
 
-    struct_p.SetDimensions(nx, ny, nz)
-    struct_p.SetSpacing((x1 - x0) / nx, (y1 - y0) / ny, (z1 - z0) / nz)
 
-    probe = vtk.vtkProbeFilter()
-    probe.SetInputData(struct_p)
-    probe.SetSourceData(data)
-    log.warning("Starting probe. The process may take a long time.", draw_win=False)
-    probe.Update()
-    log.warning("Probe complete.", draw_win=False)
+def volume_array(values, dim, reverse=(False, False, False)):
+    """Reshape the values of a volumetric array to (nz, ny, nx) and
+    apply the reverse flags of each axis, without copying them.
+    """
+    nx, ny, nz = dim
+    rx, ry, rz = reverse
+    volume = values.reshape(nz, ny, nx)
+    if rz:
+        volume = volume[::-1]
+    if ry:
+        volume = volume[:, ::-1]
+    if rx:
+        volume = volume[:, :, ::-1]
+    return volume
+
+
+def volume_rolls(dim, shift=(0, 0), reverse=(False, False, False)):
+    """Return the roll of the y and x axis of a volume given by
+    volume_array equivalent to the shift (a fraction of the size) of
+    shift_reverse_range, which is applied before the reverse.
+    """
+    nx, ny = dim[0], dim[1]
+    shift_x, shift_y = int(nx * shift[0]), int(ny * shift[1])
+    return (shift_y if reverse[1] else -shift_y,
+            shift_x if reverse[0] else -shift_x)
 
-    probe_out = probe.GetOutput()
 
-    return probe_out
+def volume_file_path(name, extension=".bvox", subdir=""):
+    """Return the path of the file of the given volume, inside
+    the given subdirectory of the output directory, creating
+    the directory if needed.
+    """
+    output_dir = os.path.join(get_addon_pref("output_path"), subdir)
+    if not os.path.exists(output_dir):
+        try:
+            os.makedirs(output_dir)
+        except OSError:
+            log.error("Tmp directory to store volume data couldn't "
+                      "be created in path '{}'".format(output_dir))
+            return None
+        else:
+            log.info("Tmp directory created in '{}'.".format(output_dir))
+    return os.path.join(output_dir, name+extension)
 
 
-def vtk_data_to_volume(data, name, color_node, use_probing=False, probe_resolution=(250, 250, 250),
-                       shift=(0, 0), create_box=True):
-    """Convert vtk volumetric data to a Blender object with a volumetric material."""
-    from array import array
+# Size in bytes of the header of blender voxel files
+bvox_header_size = 16
+
+
+def slab_layers(nx, ny, copies=1):
+    """Return how many z layers of a volume fit in the slab
+    size set in the add-on preferences, given the number of
+    float32 copies of each slab needed.
+    """
+    slab_size = (get_addon_pref("volume_slab_size") or 256) * 1024 * 1024
+    return max(1, slab_size // (nx * ny * 4 * copies))
+
+
+def create_bvox(file_path, dim, n_frames=1):
+    """Create a blender voxel file with the given dimensions and
+    number of frames, sized in advance to hold all the frames.
+    """
+    nx, ny, nz = dim
+    header = np.array([nx, ny, nz, n_frames], dtype=np.uint32)
+    with open(file_path, 'wb') as bin_file:
+        header.tofile(bin_file)
+        bin_file.truncate(bvox_header_size + nx * ny * nz * n_frames * 4)
+
+
+def normalized_slabs(volume, min_r, max_r, rolls=(0, 0)):
+    """Yield the z slabs of a (nz, ny, nx) volume as (z0, z1, slab)
+    tuples, where slab is a float32 copy of the layers from z0 to z1,
+    normalized in the given range and rolled on the y and x axis. The
+    slab size is bounded by the add-on preferences.
+    """
+    nz, ny, nx = volume.shape
+    # Each slab needs a float32 copy, plus a second one when rolled
+    layers = slab_layers(nx, ny, 2 if any(rolls) else 1)
+    scale = np.float32(1 / (max_r - min_r))
+
+    for z0 in range(0, nz, layers):
+        z1 = min(z0 + layers, nz)
+        slab = np.subtract(volume[z0:z1], min_r, dtype=np.float32)
+        slab *= scale
+        if rolls[0]:
+            slab = np.roll(slab, rolls[0], axis=1)
+        if rolls[1]:
+            slab = np.roll(slab, rolls[1], axis=2)
+        yield z0, z1, slab
+
+
+def write_bvox_frame(file_path, volume, min_r, max_r, rolls=(0, 0), frame=0):
+    """Write a (nz, ny, nx) volume into a frame of an existing blender
+    voxel file, normalizing its values in the given range and rolling
+    the y and x axis. The file is filled one z slab at a time through
+    a memory map, so that the memory used is bounded.
+    """
+    nz, ny, nx = volume.shape
+    out = np.memmap(file_path, dtype=np.float32, mode="r+",
+                    offset=bvox_header_size + frame * nx * ny * nz * 4, shape=(nz, ny, nx))
+    for z0, z1, slab in normalized_slabs(volume, min_r, max_r, rolls):
+        out[z0:z1] = slab
+    out.flush()
+    del out
+
+
+def write_volume(file_path, volume, min_r, max_r, rolls=(0, 0), crop=None, quantize=False):
+    """Write a (nz, ny, nx) volume to a single frame voxel file: a
+    blender voxel file or, if quantize is true, a raw 8 bit file. If
+    crop is given, as ((z0, z1), (y0, y1), (x0, x1)) index ranges,
+    only the voxels inside are written. Return the dimensions
+    (nx, ny, nz) of the written volume.
+    """
+    nz, ny, nx = volume.shape
+    (z0, z1), (y0, y1), (x0, x1) = crop or ((0, nz), (0, ny), (0, nx))
+    shape = (z1 - z0, y1 - y0, x1 - x0)
+
+    if quantize:
+        # Raw 8 bit files have no header
+        with open(file_path, 'wb') as raw_file:
+            raw_file.truncate(shape[0] * shape[1] * shape[2])
+        out = np.memmap(file_path, dtype=np.uint8, mode="r+", shape=shape)
+    else:
+        create_bvox(file_path, shape[::-1])
+        out = np.memmap(file_path, dtype=np.float32, mode="r+", offset=bvox_header_size, shape=shape)
+
+    for s0, s1, slab in normalized_slabs(volume[z0:z1], min_r, max_r, rolls):
+        slab = slab[:, y0:y1, x0:x1]
+        if quantize:
+            slab = np.clip(slab, 0, 1)
+            slab = (slab * 255 + 0.5).astype(np.uint8)
+        out[s0:s1] = slab
+    out.flush()
+    del out
+    return shape[::-1]
+
+
+def alpha_bounding_box(volume, min_r, max_r, ramp, rolls=(0, 0), samples=1024):
+    """Find the bounding box of the voxels whose color, according to
+    the given ramp, has a non zero alpha. Return it as index ranges
+    ((z0, z1), (y0, y1), (x0, x1)) or None if all the voxels are
+    transparent.
+    """
+    nz, ny, nx = volume.shape
+    visible = np.array([ramp.evaluate(i / (samples - 1))[3] > 0 for i in range(samples)])
+    z_any = np.zeros(nz, dtype=bool)
+    y_any = np.zeros(ny, dtype=bool)
+    x_any = np.zeros(nx, dtype=bool)
+
+    for z0, z1, slab in normalized_slabs(volume, min_r, max_r, rolls):
+        np.clip(slab, 0, 1, out=slab)
+        mask = visible[(slab * (samples - 1) + 0.5).astype(np.int32)]
+        z_any[z0:z1] = mask.any(axis=(1, 2))
+        y_any |= mask.any(axis=(0, 2))
+        x_any |= mask.any(axis=(0, 1))
+
+    if not z_any.any():
+        return None
+    return tuple((int(axis.nonzero()[0][0]), int(axis.nonzero()[0][-1]) + 1)
+                 for axis in (z_any, y_any, x_any))
+
 
+def normalize_bvox(file_path, min_r, max_r):
+    """Normalize in place all the values of a blender voxel file in the
+    given range, one slab at a time.
+    """
+    nx, ny, nz, n_frames = np.fromfile(file_path, dtype=np.uint32, count=4)
+    data = np.memmap(file_path, dtype=np.float32, mode="r+", offset=bvox_header_size,
+                     shape=(int(nz) * int(n_frames), int(ny), int(nx)))
+    layers = slab_layers(int(nx), int(ny))
+    scale = np.float32(1 / (max_r - min_r))
+    for z0 in range(0, len(data), layers):
+        slab = data[z0:z0 + layers]
+        slab -= np.float32(min_r)
+        slab *= scale
+    data.flush()
+    del data
+
+
+def prepare_volume(data, color_node, use_probing=False, probe_resolution=(250, 250, 250),
+                   values_key=None):
+    """Probe the data if requested and read the array selected on the
+    color node. Return a tuple (values, data, reverse), where values is
+    a flat numpy array and reverse contains the reverse flags of the xyz
+    axis, or None if the data can't be converted. If values_key (see
+    volume_values_key) is given, the last probed data is reused when
+    the key matches.
+    """
     if not color_node:
         log.error("Volume rendering requires a color mapper node. Connect one "
                   "before the 'To Blender' to select the data array and the range.")
-        return
+        return None
 
     data_array = get_color_array(data, color_node)[0]
 
     if not data_array:
         log.error("Couldn't retrieve the data array from the color mapper: "
                   "make sure there is a valid 'color by' array selected.")
-        return
+        return None
 
     # Reverse coordinates
-    rx, ry, rz = False, False, False
+    reverse = False, False, False
 
     if use_probing:
-        data = probe_grid(data, probe_resolution)
+        probed = ProbeCache.get(values_key) if values_key else None
+        if probed:
+            log.info("Reusing the probed volume.")
+        else:
+            probed = probe_grid(data, probe_resolution, data_array.GetName())
+            if values_key:
+                # Only the last probed volume is kept, it may be large
+                ProbeCache.clear()
+                ProbeCache[values_key] = probed
+        data = probed
         data_array = data.GetPointData().GetArray(data_array.GetName())
     elif issubclass(data.__class__, vtk.vtkRectilinearGrid):
         scan_res = scan_rect_grid(data, non_uniform_warning="Non uniform coordinates in the {}-axis. "
                                                             "It is advisable to use probing.")
-        rx, ry, rz = scan_res[0]
+        reverse = tuple(scan_res[0])
 
-    dim = data.GetDimensions()
-    min_r, max_r = color_node.range_min, color_node.range_max
-
-    if color_node.auto_range:
-        # Update after probing
-        min_r, max_r = data_array.GetRange()
+    values = array_values(data_array, color_node.array_component)
+    return values, data, reverse
 
-    if max_r - min_r == 0:
-        log.error("Can't unwrap: the range is constant ({}, {}). "
-                  "Define a valid range and try again.".format(max_r, min_r))
-        return
 
-    nx, ny, nz = dim[0], dim[1], dim[2]
-    nf = 1
-    header = [nx, ny, nz, nf]
-    vol_data = []
-    shift_x = int(nx * shift[0])
-    shift_y = int(ny * shift[1])
-    bar = ChargingBar("Processing volume", max=(nf * nz))
-
-    for t in range(nf):  # frame
-        for z in reverse_range(nz, rz):  # layer
-            bar.next()
-            for y in shift_reverse_range(ny, shift_y, ry):  # line
-                for x in shift_reverse_range(nx, shift_x, rx):  # value
-                    # index = t*(nx*ny*nz) + z*(nx*ny) + y*nx + x
-                    # val = (data_array.GetValue(index) - min_r) / (max_r - min_r)
-                    # vol_data.append(val)
-                    #
-                    # Compact and faster version
-                    vol_data.append(
-                        (data_array.GetValue(t * nx * ny * nz + z * nx * ny + y * nx + x) - min_r) / (max_r - min_r)
-                    )
-
-    bar.finish()
-    output_dir = get_addon_pref("output_path")
-    file_path = os.path.join(output_dir, name+".bvox")
+def volume_grid(data):
+    """Return the grid of volumetric data as a tuple (bounds, dimensions),
+    where bounds is None if the data has no bounds.
+    """
+    bounds = data.GetBounds() if hasattr(data, "GetBounds") else None
+    return bounds, tuple(data.GetDimensions())
 
-    if not os.path.exists(output_dir):
-        try:
-            os.makedirs(output_dir)
-        except OSError:
-            log.error("Tmp directory to store volume data couldn't "
-                      "be created in path '{}'".format(output_dir))
-        else:
-            log.info("Tmp directory created in '{}'.".format(output_dir))
 
-    bin_file = open(file_path, 'wb')
-    header = array("I", header)
-    vol_data = array("f", vol_data)
-    header.tofile(bin_file)
-    vol_data.tofile(bin_file)
-    log.info("Volumetric file created in '{}'.".format(file_path))
+def volume_box(name, grid, file_path, color_node, create_box=True, crop=None, raw_dim=None):
+    """Create the box displaying the volume stored in the given file,
+    or only set the file in the color node texture. The box covers
+    the given volume grid (see volume_grid) or, if the volume has been
+    cropped, the crop ranges of it. If raw_dim is given the file is a
+    raw 8 bit file with those dimensions. Return the voxel texture
+    (None if it's not available).
+    """
+    texture = color_node.get_texture()
 
     if not create_box:
-        texture = color_node.get_texture()
         if hasattr(texture, "voxel_data"):
             texture.voxel_data.filepath = file_path
-        else:
-            log.warning("The color ramp texture is not of voxel type. You should "
-                        "update again checking the option 'create box' to properly "
-                        "setup the texture.")
-        return
+            set_voxel_format(texture, raw_dim)
+            return texture
+        log.warning("The color ramp texture is not of voxel type. You should "
+                    "update again checking the option 'create box' to properly "
+                    "setup the texture.")
+        return None
 
     me, ob = mesh_and_object(name)
 
     pos = (0, 0, 0)
-    if hasattr(data, "GetBounds"):
-        bounds = evaluate_bounds(data.GetBounds())
-        if bounds:
-            pos, dim = bounds
+    data_bounds, n = grid
+    dim = n
+    bounds = evaluate_bounds(data_bounds)
+    if bounds:
+        pos, dim = bounds
+
+    if crop:
+        # Voxel i covers the fraction [i/n, (i+1)/n] of each axis
+        pos, dim = list(pos), list(dim)
+        for axis, (i0, i1) in zip((2, 1, 0), crop):
+            pos[axis] += dim[axis] * i0 / n[axis]
+            dim[axis] *= (i1 - i0) / n[axis]
 
     parallelepiped(dim, layers=2, pos=pos).to_mesh(me)
-    texture = color_node.get_texture()
     voxel_material(me, name, file_path, texture, color_node.reset_materials)
+    if hasattr(texture, "voxel_data"):
+        set_voxel_format(texture, raw_dim)
+    return texture
+
+
+def set_voxel_format(texture, raw_dim=None):
+    """Set the file format of a voxel data texture: raw 8 bit with
+    the given dimensions, or blender voxel if raw_dim is None.
+    """
+    if raw_dim:
+        texture.voxel_data.file_format = "RAW_8BIT"
+        texture.voxel_data.resolution = raw_dim
+    else:
+        texture.voxel_data.file_format = "BLENDER_VOXEL"
+
+
+def volume_values_key(data, color_node, use_probing, probe_resolution):
+    """Return a string identifying the values of the volume before they
+    are normalized in the range: the geometry of the data, the content
+    of the selected array and the probing resolution. Data without a
+    fingerprint are identified by address and modification time.
+    """
+    data_array = get_color_array(data, color_node)[0]
+    fingerprint = data_fingerprint(data)
+    if not fingerprint:
+        fingerprint = data.GetAddressAsString(data.GetClassName()), data.GetMTime()
+    parts = [fingerprint, data_array.GetName() if data_array else None,
+             array_checksum(data_array) if data_array else None]
+    if use_probing:
+        parts.append(tuple(probe_resolution))
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def volume_key(values_key, color_node, shift, quantize, crop):
+    """Return a string identifying the volume file written for the values
+    identified by values_key (see volume_values_key) with the settings
+    of the color node and the given ones.
+    """
+    parts = [values_key, color_node.array_component, color_node.auto_range,
+             color_node.range_min, color_node.range_max, tuple(shift), quantize]
+    if crop:
+        # The crop depends on which values are transparent
+        ramp = color_node.get_texture().color_ramp
+        parts.append([(e.position, e.color[3]) for e in ramp.elements])
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def evict_volume_files(keep=()):
+    """Delete the least recently used volume files of the cache
+    directory, until their total size fits the volume cache size set
+    in the add-on preferences. Files used by voxel textures and the
+    given ones are kept. Baked sequences are written outside the
+    cache directory and never evicted.
+    """
+    output_dir = os.path.join(get_addon_pref("output_path"), volume_cache_dir)
+    if not os.path.isdir(output_dir):
+        return
+    limit = (get_addon_pref("volume_cache_size") or 2048) * 1024 * 1024
+    kept = set(os.path.realpath(bpy.path.abspath(t.voxel_data.filepath))
+               for t in bpy.data.textures if t.type == "VOXEL_DATA")
+    kept.update(os.path.realpath(path) for path in keep)
+
+    files = []
+    for file_name in os.listdir(output_dir):
+        if file_name.endswith((".bvox", ".raw")):
+            path = os.path.join(output_dir, file_name)
+            stat = os.stat(path)
+            files.append((stat.st_mtime, stat.st_size, path))
+    total_size = sum(size for _, size, _ in files)
+
+    for _, size, path in sorted(files):
+        if total_size <= limit:
+            break
+        if os.path.realpath(path) in kept:
+            continue
+        os.remove(path)
+        total_size -= size
+        for key in [k for k, v in VolumeCache.items() if v[0] == path]:
+            del VolumeCache[key]
+        log.debug("Volume file '{}' evicted from the cache.".format(path))
+
+
+def vtk_data_to_volume(data, name, color_node, use_probing=False, probe_resolution=(250, 250, 250),
+                       shift=(0, 0), create_box=True, quantize=False, crop=False):
+    """Convert vtk volumetric data to a Blender object with a volumetric material.
+    The volume can be quantized to 8 bits, and cropped to the voxels that
+    are not fully transparent according to the color ramp. If the same
+    data has already been written with the same settings, the existing
+    file is linked again without probing or writing anything. Data
+    is identified by content, so it's found again also if the pipeline
+    is executed again; if only the range changes, the probed data is
+    reused.
+    """
+    key = values_key = None
+    if color_node:
+        values_key = volume_values_key(data, color_node, use_probing, probe_resolution)
+        key = volume_key(values_key, color_node, shift, quantize, crop)
+    cached = VolumeCache.get(key)
+    if cached and os.path.exists(cached[0]):
+        file_path, grid, crop_ranges, raw_dim = cached
+        # Mark the file as recently used
+        os.utime(file_path)
+        log.info("Reusing the volumetric file '{}'.".format(file_path))
+    else:
+        written = write_volume_file(data, name, key, color_node, use_probing, probe_resolution,
+                                    shift, quantize, crop, values_key)
+        if not written:
+            return
+        file_path, grid, crop_ranges, raw_dim = VolumeCache[key] = written
+        evict_volume_files(keep=(file_path,))
+
+    texture = volume_box(name, grid, file_path, color_node, create_box, crop_ranges, raw_dim)
+    if texture:
+        texture.voxel_data.use_still_frame = True
+        texture.voxel_data.still_frame = 1
+
+
+def write_volume_file(data, name, key, color_node, use_probing=False, probe_resolution=(250, 250, 250),
+                      shift=(0, 0), quantize=False, crop=False, values_key=None):
+    """Write the volume file of vtk volumetric data, named after the
+    volume and its key. Return a tuple (file path, grid, crop ranges,
+    raw dimensions) or None on failure.
+    """
+    prepared = prepare_volume(data, color_node, use_probing, probe_resolution, values_key)
+    if not prepared:
+        return None
+    values, data, reverse = prepared
+
+    start_time = time.perf_counter()
+    dim = data.GetDimensions()
+    min_r, max_r = color_node.range_min, color_node.range_max
+    if color_node.auto_range:
+        # The range of the selected component, after probing
+        min_r, max_r = float(values.min()), float(values.max())
+
+    if max_r - min_r == 0:
+        log.error("Can't unwrap: the range is constant ({}, {}). "
+                  "Define a valid range and try again.".format(max_r, min_r))
+        return None
+
+    volume = volume_array(values, dim, reverse)
+    rolls = volume_rolls(dim, shift, reverse)
+    file_path = volume_file_path("{} {}".format(name, key[:12]), ".raw" if quantize else ".bvox",
+                                 volume_cache_dir)
+    if not file_path:
+        return None
+
+    crop_ranges = None
+    if crop:
+        crop_ranges = alpha_bounding_box(volume, min_r, max_r, color_node.get_texture().color_ramp, rolls)
+        if not crop_ranges:
+            log.warning("The volume is fully transparent: nothing to crop.")
+
+    written_dim = write_volume(file_path, volume, min_r, max_r, rolls, crop_ranges, quantize)
+    log.info("Volumetric file created in '{}' in {:.2f} s ({}x{}x{} voxels)."
+             .format(file_path, time.perf_counter() - start_time, *written_dim))
+    return file_path, volume_grid(data), crop_ranges, written_dim if quantize else None
+
+
+def vtk_data_to_volume_sequence(frames, n_frames, name, color_node, use_probing=False,
+                                probe_resolution=(250, 250, 250), shift=(0, 0), create_box=True):
+    """Bake the vtk data yielded by 'frames' (one for each time step)
+    into a single multi frame blender voxel file, played back by the
+    voxel texture on the scene frames 1 to n_frames. Raw values are
+    written first, then the whole file is normalized in the range of
+    the color node or, if automatic, in the range of all the frames.
+    Return true on success.
+    """
+    file_path = volume_file_path(name)
+    if not file_path:
+        return False
+
+    start_time = time.perf_counter()
+    first_dim = None
+    min_r, max_r = math.inf, -math.inf
+    data = None
+
+    for frame, frame_data in enumerate(frames):
+        prepared = prepare_volume(frame_data, color_node, use_probing, probe_resolution)
+        if not prepared:
+            return False
+        values, data, reverse = prepared
+        dim = tuple(data.GetDimensions())
+
+        if first_dim is None:
+            first_dim = dim
+            create_bvox(file_path, dim, n_frames)
+        elif dim != first_dim:
+            log.error("Time step {} has dimensions {}, different from the ones of the "
+                      "first time step {}: can't bake the sequence.".format(frame, dim, first_dim))
+            return False
+
+        min_r, max_r = min(min_r, float(values.min())), max(max_r, float(values.max()))
+        write_bvox_frame(file_path, volume_array(values, dim, reverse), 0, 1,
+                         volume_rolls(dim, shift, reverse), frame)
+        log.info("Volume frame {} of {} baked.".format(frame + 1, n_frames), draw_win=False)
+
+    if first_dim is None:
+        log.error("No time steps to bake.")
+        return False
+
+    if not color_node.auto_range:
+        min_r, max_r = color_node.range_min, color_node.range_max
+    if max_r - min_r == 0:
+        log.error("Can't unwrap: the range is constant ({}, {}). "
+                  "Define a valid range and try again.".format(max_r, min_r))
+        return False
+    normalize_bvox(file_path, min_r, max_r)
+
+    texture = volume_box(name, volume_grid(data), file_path, color_node, create_box)
+    if texture:
+        # Frames are read from the file following the scene frame
+        texture.voxel_data.use_still_frame = False
+    log.info("Volume sequence of {} frames baked in '{}' in {:.2f} s. Scene frames 1 to {} "
+             "play it back.".format(n_frames, file_path, time.perf_counter() - start_time, n_frames),
+             draw_win=True)
+    return True
 
 
 # ---------------------------------------------------------------------------------
@@ -808,8 +2359,271 @@ def evaluate_bounds(bounds):
     return origin, dim
 
 
-def vtk_data_to_image(data, name, color_node, shift=(0, 0), create_plane=True, z_level=0):
-    """Convert vtkImageData to a Blender image"""
+def shifted_indices(n, shift=0, reverse=False):
+    """Return the integers from 0 to n as a numpy array, in the
+    order of shift_reverse_range.
+    """
+    indices = np.arange(n)
+    if reverse:
+        indices = indices[::-1]
+    return (indices + shift) % n
+
+
+def image_colors(values, data_range, lut=None):
+    """Return the (ny, nx, 4) rgba colors of a (ny, nx, components)
+    array of values, normalized in the given range. Single component
+    values are colored with the lookup table of a ramp (see ramp_lut),
+    or in gray scale if there is no table; the others are used as
+    rgb(a) colors.
+    """
+    min_r, max_r = data_range
+    values = np.subtract(values, min_r, dtype=np.float32)
+    values *= np.float32(1 / (max_r - min_r))
+    np.clip(values, 0, 1, out=values)
+
+    n_components = values.shape[2]
+    if n_components == 1:
+        if lut is not None:
+            return lut_colors(values[:, :, 0], lut)
+        pixels = np.repeat(values, 4, axis=2)
+        pixels[:, :, 3] = 1
+        return pixels
+
+    pixels = np.zeros(values.shape[:2] + (4,), dtype=np.float32)
+    pixels[:, :, 3] = 1  # Alpha
+    pixels[:, :, :min(n_components, 4)] = values[:, :, :4]
+    return pixels
+
+
+def scalar_image_pixels(values):
+    """Return the (ny, nx, 4) pixels of an image storing the raw
+    values of a (ny, nx, 1) array in the color channels.
+    """
+    pixels = np.repeat(values.astype(np.float32, copy=False), 4, axis=2)
+    pixels[:, :, 3] = 1
+    return pixels
+
+
+def image_pixels(values, data_range, lut=None, shader_colors=False):
+    """Return the (ny, nx, 4) pixels of an image of a (ny, nx, components)
+    array of values: raw values if shader_colors is true, otherwise
+    colors (see image_colors). Only numpy is used, so it can run in
+    worker threads.
+    """
+    if shader_colors:
+        return scalar_image_pixels(values)
+    return image_colors(values, data_range, lut)
+
+
+def write_image(name, pixels, shader_colors=False):
+    """Get or create the image with the given name and write the
+    (ny, nx, 4) pixels in it. Return the image.
+    """
+    ny, nx = pixels.shape[:2]
+    img = get_image(name, (nx, ny))
+    if shader_colors:
+        img.use_generated_float = True
+        img.colorspace_settings.name = "Non-Color"
+    set_image_pixels(img, pixels)
+    return img
+
+
+def image_plane_area(data):
+    """Return the position and the (x, y) size of the plane
+    displaying the image of the given data.
+    """
+    dim = data.GetDimensions()
+    spacing = data.GetSpacing() if hasattr(data, "GetSpacing") else (1,)
+    pos = (0, 0, 0)
+
+    if hasattr(data, "GetBounds"):
+        bounds = evaluate_bounds(data.GetBounds())
+        if bounds:
+            pos, dim = bounds
+
+    return pos, (dim[0] * spacing[0], dim[1] * spacing[0])
+
+
+def image_plane(name, img, pos, size, location, colors):
+    """Create or update the plane object showing the given image,
+    with the given position and size. colors is a tuple (shader
+    colors, color ramp, data range, reset materials) defining the
+    material. Return the object.
+    """
+    # Create plane mesh with UVs to show the image
+    plane = plane_bmesh(size, pos)
+    uv_layer = get_item(plane.loops.layers.uv, default_uv_map)
+    plane.faces.ensure_lookup_table()
+    plane.faces[0].loops[0][uv_layer].uv = (0, 0)
+    plane.faces[0].loops[1][uv_layer].uv = (1, 0)
+    plane.faces[0].loops[2][uv_layer].uv = (1, 1)
+    plane.faces[0].loops[3][uv_layer].uv = (0, 1)
+
+    me, ob = mesh_and_object(name)
+    if location:
+        ob.location = location
+
+    plane.to_mesh(me)
+    shader_colors, color_ramp, data_range, reset_materials = colors
+    if shader_colors:
+        scalar_image_material(me, name, img, color_ramp, data_range, reset_materials)
+    else:
+        image_material(me, name, img, reset_materials)
+    return ob
+
+
+def image_tiles(nx, ny, tile_size):
+    """Split an image in tiles at most tile_size pixels wide and tall.
+    Return a list of (i, j, (x0, x1), (y0, y1)) tuples, where i and j
+    are the column and row of the tile and the ranges its pixels.
+    """
+    return [(i, j, (x0, min(x0 + tile_size, nx)), (y0, min(y0 + tile_size, ny)))
+            for j, y0 in enumerate(range(0, ny, tile_size))
+            for i, x0 in enumerate(range(0, nx, tile_size))]
+
+
+def tile_name(name, i, j):
+    """Return the name of the object and image of a tile."""
+    return "{} Tile {} {}".format(name, i, j)
+
+
+def level_name(name, k):
+    """Return the name of the object and image of a z level."""
+    return "{} Z {}".format(name, k)
+
+
+def level_height(data, k):
+    """Return the height of the z level k of the data, relative
+    to the first one.
+    """
+    if hasattr(data, "GetZCoordinates"):
+        z = data.GetZCoordinates()
+        return z.GetTuple1(k) - z.GetTuple1(0)
+    if hasattr(data, "GetSpacing"):
+        return k * data.GetSpacing()[2]
+    return k
+
+
+def remove_image_objects(name, keep=()):
+    """Remove the objects and images parented to the empty 'name'
+    (the tiles or levels of an image), except the ones named in keep,
+    together with their own children. If nothing is kept the empty
+    is removed too.
+    """
+    parent = bpy.data.objects.get(name)
+    if not parent or parent.type != "EMPTY":
+        return
+    for child in parent.children:
+        if child.name not in keep and child.name.startswith(name + " "):
+            remove_image_objects(child.name)
+            img = bpy.data.images.get(child.name)
+            if child.name in bpy.data.objects:
+                bpy.data.objects.remove(child, do_unlink=True)
+            if img:
+                bpy.data.images.remove(img)
+    if not keep:
+        bpy.data.objects.remove(parent, do_unlink=True)
+
+
+def remove_image_plane(name):
+    """Remove the single plane object 'name', its mesh and the image
+    'name', left by an image converted before it was split in tiles.
+    """
+    ob = bpy.data.objects.get(name)
+    if ob and ob.type == "MESH":
+        me = ob.data
+        bpy.data.objects.remove(ob, do_unlink=True)
+        if not me.users:
+            bpy.data.meshes.remove(me)
+    img = bpy.data.images.get(name)
+    if img:
+        bpy.data.images.remove(img)
+
+
+def image_planes(name):
+    """Return the plane objects of the image 'name': the object
+    itself or, for tiled images and levels, the planes parented to it.
+    """
+    ob = bpy.data.objects.get(name)
+    if not ob:
+        return []
+    if ob.type != "EMPTY":
+        return [ob]
+    return [plane for child in ob.children for plane in image_planes(child.name)]
+
+
+def refresh_image_materials(name, ramp, data_range):
+    """Set range and color ramp of the raw values materials of all
+    the planes of the image 'name' (see image_planes). Return False
+    if some material is not available.
+    """
+    results = [refresh_scalar_material(plane.name, ramp, data_range) for plane in image_planes(name)]
+    return bool(results) and all(results)
+
+
+def image_level(name, values, ys, xs, pos, size, location, colors, create_plane=True,
+                tile_size=0, tiles=None):
+    """Convert a (ny, nx, components) array of values into an image,
+    or into tiles if it's larger than tile_size, and their planes (see
+    vtk_data_to_image). ys and xs are the indices of the rows and
+    columns of the image. Return the plane object, or the empty the
+    tiles are parented to, or None if no plane is created.
+    """
+    ny, nx = len(ys), len(xs)
+    shader_colors, color_ramp, data_range, reset_materials = colors
+    # The ramp is sampled here, blender data can't be read from the tile workers
+    lut = ramp_lut(color_ramp) if color_ramp and not shader_colors else None
+
+    if not tile_size or (nx <= tile_size and ny <= tile_size):
+        remove_image_objects(name)
+        img = write_image(name, image_pixels(values[np.ix_(ys, xs)], data_range, lut, shader_colors),
+                          shader_colors)
+        if create_plane:
+            return image_plane(name, img, pos, size, location, colors)
+        return None
+
+    all_tiles = image_tiles(nx, ny, tile_size)
+    todo = [tile for tile in all_tiles if tiles is None or tile[:2] in tiles]
+    remove_image_plane(name)
+    parent = get_empty(name) if create_plane else None
+
+    def tile_pixels(tile):
+        # Only the values of the tile are copied
+        i, j, (x0, x1), (y0, y1) = tile
+        return image_pixels(values[np.ix_(ys[y0:y1], xs[x0:x1])], data_range, lut, shader_colors)
+
+    # Tiles are colored concurrently, a batch at a time so that the
+    # memory used is bounded, then written into blender images
+    workers = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for b in range(0, len(todo), workers):
+            batch = todo[b:b + workers]
+            for tile, pixels in zip(batch, executor.map(tile_pixels, batch)):
+                i, j, (x0, x1), (y0, y1) = tile
+                t_name = tile_name(name, i, j)
+                img = write_image(t_name, pixels, shader_colors)
+                if parent:
+                    t_pos = (pos[0] + size[0] * x0 / nx, pos[1] + size[1] * y0 / ny, pos[2])
+                    t_size = size[0] * (x1 - x0) / nx, size[1] * (y1 - y0) / ny
+                    image_plane(t_name, img, t_pos, t_size, location, colors).parent = parent
+
+    if tiles is None:
+        remove_image_objects(name, keep=[tile_name(name, i, j) for i, j, _, _ in all_tiles])
+    log.info("{} of {} image tiles of '{}' created.".format(len(todo), len(all_tiles), name), draw_win=False)
+    return parent
+
+
+def vtk_data_to_image(data, name, color_node, shift=(0, 0), create_plane=True, z_level=0,
+                      shader_colors=False, tile_size=0, tiles=None, all_levels=False):
+    """Convert vtkImageData to a Blender image. With shader_colors, the
+    image stores the raw values of a single component array as floats,
+    mapped to colors by the range and ramp in the material. If the image
+    is larger than tile_size, it's split in tiles, each one with its own
+    image and plane, parented to an empty named 'name'. tiles can be a
+    set of (column, row) indices of the only tiles to update. With
+    all_levels, every z level is converted into its own image, with the
+    planes stacked at the level heights and parented to an empty.
+    """
     if issubclass(data.__class__, bpy.types.ColorRamp):
         ramp_to_image(data, name)
         log.info("Color ramp image created: '{}'.".format(name), draw_win=True)
@@ -845,13 +2659,10 @@ def vtk_data_to_image(data, name, color_node, shift=(0, 0), create_plane=True, z
         log.error("Range is constant. Please select a proper range.")
         return
 
-    if dim[2] > 1:
+    if dim[2] > 1 and not all_levels:
         log.warning("Input data has more than one dimension in the z-axis.\n"
                     "You may try to choose volume as an output type.")
 
-    img = get_image(name, dim)
-
-    p = []
     nx, ny, nz = dim[0], dim[1], dim[2]
 
     # Reverse coordinates
@@ -863,66 +2674,186 @@ def vtk_data_to_image(data, name, color_node, shift=(0, 0), create_plane=True, z
                                   exclude=("z",))
         rx, ry = scan_res[0]
 
-    bar = ChargingBar("Processing image", max=ny)
-    shift_x = int(nx * shift[0])
-    shift_y = int(ny * shift[1])
-    tuple_size = len(data_array.GetTuple(0))
     n_tuples = data_array.GetNumberOfTuples()
-    z_offset = z_level*nx*ny
+    levels = range(nz) if all_levels else [z_level]
 
-    if (ny-1) * nx + (nx-1) + z_offset >= n_tuples:
+    if (levels[-1] + 1)*nx*ny > n_tuples:
         log.error("Input data isn't suitable to become an image,\n"
                   "maybe due to a three-dimensional structure.\n"
                   "Try to change the output type.")
         return
 
-    for y in shift_reverse_range(ny, shift_y, ry):  # line
-        bar.next()
+    # A view on the vtk array: values are copied only when colored
+    values = vtk_to_numpy(data_array).reshape(n_tuples, -1)[:(levels[-1] + 1)*nx*ny]
+    values = values.reshape(-1, ny, nx, values.shape[1])
+    ys = shifted_indices(ny, int(ny * shift[1]), ry)
+    xs = shifted_indices(nx, int(nx * shift[0]), rx)
+
+    render_engine = bpy.context.scene.render.engine
+    if shader_colors and not (values.shape[3] == 1 and color_ramp and
+                              render_engine in ("CYCLES", "BLENDER_EEVEE")):
+        log.warning("Shader colors need cycles and a single component array colored by "
+                    "a ramp: the colors are written in the image.")
+        shader_colors = False
+
+    start_time = time.perf_counter()
+    colors = shader_colors, color_ramp, data_range, reset_materials
+    location = data.GetOrigin() if hasattr(data, "GetOrigin") else None
+    pos, size = image_plane_area(data)
+
+    if not all_levels:
+        image_level(name, values[z_level], ys, xs, pos, size, location, colors,
+                    create_plane, tile_size, tiles)
+    else:
+        remove_image_plane(name)
+        parent = get_empty(name) if create_plane else None
+        for k in levels:
+            k_pos = pos[0], pos[1], pos[2] + level_height(data, k)
+            ob = image_level(level_name(name, k), values[k], ys, xs, k_pos, size, location, colors,
+                             create_plane, tile_size, tiles)
+            if ob:
+                ob.parent = parent
+        remove_image_objects(name, keep=[level_name(name, k) for k in levels])
 
-        for x in shift_reverse_range(nx, shift_x, rx):  # value
-            t = data_array.GetTuple(y * nx + x + z_offset)
-            if tuple_size == 1:
-                val = normalize_value(t[0], data_range)
-                if color_ramp:
-                    p.extend(color_ramp.evaluate(val))
-                else:
-                    p.extend((val, val, val, 1))
-            else:
-                for val in normalize_tuple(t, data_range):
-                    p.append(val)
-                if tuple_size < 4:
-                    p.append(1)  # Alpha
+    log.info("{} image{} created in {:.2f} s, {} pixels each."
+             .format(len(levels), "s" if len(levels) > 1 else "",
+                     time.perf_counter() - start_time, nx * ny), draw_win=True)
 
-    bar.finish()
-    img.pixels = p
-    log.info("Image created, {} pixels.".format(len(p)), draw_win=True)
 
-    if not create_plane:
+# ---------------------------------------------------------------------------------
+#   Orthogonal slices
+# ---------------------------------------------------------------------------------
+
+
+def vtk_data_to_slices(data, name, color_node, indices=(0, 0, 0), use_probing=False,
+                       probe_resolution=(250, 250, 250)):
+    """Convert vtk volumetric data into a normalized numpy volume, kept
+    in the slices cache, and show its orthogonal slices at the given
+    (x, y, z) indices. Later slices are extracted from the cache by
+    update_slices, without converting the data again.
+    """
+    prepared = prepare_volume(data, color_node, use_probing, probe_resolution)
+    if not prepared:
         return
+    values, data, reverse = prepared
 
-    # Create plane mesh with UVs to show the image
-    spacing = data.GetSpacing() if hasattr(data, "GetSpacing") else (1,)
-    pos = (0, 0, 0)
+    start_time = time.perf_counter()
+    min_r, max_r = color_node.range_min, color_node.range_max
+    if color_node.auto_range:
+        min_r, max_r = float(values.min()), float(values.max())
 
-    if hasattr(data, "GetBounds"):
-        bounds = evaluate_bounds(data.GetBounds())
-        if bounds:
-            pos, dim = bounds
+    if max_r - min_r == 0:
+        log.error("Range is constant. Please select a proper range.")
+        return
 
-    x = dim[0] * spacing[0]
-    y = dim[1] * spacing[0]
-    plane = plane_bmesh((x, y), pos)
-    uv_layer = get_item(plane.loops.layers.uv, default_uv_map)
-    plane.faces.ensure_lookup_table()
-    plane.faces[0].loops[0][uv_layer].uv = (0, 0)
-    plane.faces[0].loops[1][uv_layer].uv = (1, 0)
-    plane.faces[0].loops[2][uv_layer].uv = (1, 1)
-    plane.faces[0].loops[3][uv_layer].uv = (0, 1)
+    # Values are not clipped, so that the range can be changed later
+    volume = np.subtract(volume_array(values, data.GetDimensions(), reverse), min_r, dtype=np.float32)
+    volume *= np.float32(1 / (max_r - min_r))
+    SliceCache[name] = volume, volume_grid(data), (min_r, max_r)
+    update_slices(name, color_node, indices)
+    log.info("Volume of {}x{}x{} voxels cached for slicing in {:.2f} s."
+             .format(*volume.shape[::-1], time.perf_counter() - start_time), draw_win=True)
 
-    me, ob = mesh_and_object(name)
 
-    if hasattr(data, "GetOrigin"):
-        ob.location = data.GetOrigin()
+def set_slices_range(name, data_range):
+    """Normalize the cached volume of a slices output in a new range,
+    without converting the data again. Return False if there is no
+    cached volume.
+    """
+    cached = SliceCache.get(name)
+    if not cached:
+        return False
+    volume, grid, (min_r, max_r) = cached
+    new_min, new_max = data_range
+    if (new_min, new_max) != (min_r, max_r):
+        # v' = (v * (max - min) + min - new min) / (new max - new min)
+        scale = (max_r - min_r) / (new_max - new_min)
+        volume *= np.float32(scale)
+        volume += np.float32((min_r - new_min) / (new_max - new_min))
+        SliceCache[name] = volume, grid, (new_min, new_max)
+    return True
 
-    plane.to_mesh(me)
+
+def slice_name(name, axis):
+    """Return the name of the object and image of a slice."""
+    return "{} Slice {}".format(name, axis)
+
+
+def volume_slice(volume, pos, size, axis, index):
+    """Extract the slice of a (nz, ny, nx) volume, occupying the box with
+    the given position and size, across the given axis ("X", "Y" or
+    "Z") at the given index. Return the (rows, columns) slice values
+    and the corners of its plane.
+    """
+    nz, ny, nx = volume.shape
+    (x0, y0, z0), (dx, dy, dz) = pos, size
+    x1, y1, z1 = x0 + dx, y0 + dy, z0 + dz
+    # Slices cross the center of the voxels
+    if axis == "X":
+        i = min(max(index, 0), nx - 1)
+        x = x0 + dx * (i + 0.5) / nx
+        return volume[:, :, i], ((x, y0, z0), (x, y1, z0), (x, y1, z1), (x, y0, z1))
+    if axis == "Y":
+        j = min(max(index, 0), ny - 1)
+        y = y0 + dy * (j + 0.5) / ny
+        return volume[:, j, :], ((x0, y, z0), (x1, y, z0), (x1, y, z1), (x0, y, z1))
+    k = min(max(index, 0), nz - 1)
+    z = z0 + dz * (k + 0.5) / nz
+    return volume[k], ((x0, y0, z), (x1, y0, z), (x1, y1, z), (x0, y1, z))
+
+
+def slice_plane(name, img, corners, reset_materials=True):
+    """Create or move the plane object showing a slice image, with
+    the given corners (in the order of the image corners: bottom
+    left, bottom right, top right, top left). Return the object.
+    """
+    me = bpy.data.meshes.get(name)
+    ob = bpy.data.objects.get(name)
+    if me and ob and ob.data == me and len(me.vertices) == 4 and me.materials:
+        # Only the vertices need to be moved
+        me.vertices.foreach_set("co", np.array(corners, dtype=np.float32).ravel())
+        me.update()
+        return ob
+
+    bm = bmesh.new()
+    face = bm.faces.new([bm.verts.new(corner) for corner in corners])
+    uv_layer = get_item(bm.loops.layers.uv, default_uv_map)
+    for loop, uv in zip(face.loops, ((0, 0), (1, 0), (1, 1), (0, 1))):
+        loop[uv_layer].uv = uv
+    me, ob = mesh_and_object(name)
+    bm.to_mesh(me)
     image_material(me, name, img, reset_materials)
+    return ob
+
+
+def update_slices(name, color_node, indices, axes="XYZ"):
+    """Show the slices of the cached volume of a slices output at the
+    given (x, y, z) indices, updating only the given axes. Slices are
+    colored with the ramp of the color node, or in gray scale. Return
+    False if there is no cached volume.
+    """
+    cached = SliceCache.get(name)
+    if not cached:
+        return False
+    volume, grid, data_range = cached
+
+    texture = color_node.get_texture() if color_node else None
+    lut = ramp_lut(texture.color_ramp) if texture else None
+    reset_materials = color_node.reset_materials if color_node else True
+    bounds = evaluate_bounds(grid[0])
+    pos, size = bounds if bounds else ((0, 0, 0), grid[1])
+    parent = get_empty(name)
+
+    for axis, index in zip("XYZ", indices):
+        if axis not in axes:
+            continue
+        values, corners = volume_slice(volume, pos, size, axis, index)
+        if lut is not None:
+            pixels = lut_colors(values, lut)
+        else:
+            pixels = np.repeat(np.clip(values, 0, 1)[:, :, np.newaxis], 4, axis=2)
+            pixels[:, :, 3] = 1
+        s_name = slice_name(name, axis)
+        img = write_image(s_name, pixels)
+        slice_plane(s_name, img, corners, reset_materials).parent = parent
+    return True
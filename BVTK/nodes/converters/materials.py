@@ -27,6 +27,9 @@ default_uv_map = "BVTK UV"
 image_node_name = "BVTK Image Texture"
 # Name for the customized color ramp node
 ramp_node_name = "BVTK Color Ramp"
+# Names for the customized math nodes mapping raw values in the range
+range_min_node_name = "BVTK Range Min"
+range_scale_node_name = "BVTK Range Scale"
 
 
 # ---------------------------------------------------------------------------------
@@ -66,7 +69,7 @@ def image_material(mesh, name, img, reset=True):
     render_engine = bpy.context.scene.render.engine
 
     if render_engine == "CYCLES" or render_engine == "BLENDER_EEVEE":
-        if not flag or not mat.use_nodes:
+        if not flag or not mat.use_nodes or is_scalar_tree(mat):
             setup_image_tree(mat, img)
         else:
             nodes = mat.node_tree.nodes
@@ -86,6 +89,31 @@ def image_material(mesh, name, img, reset=True):
     return mat
 
 
+def scalar_image_material(mesh, name, img, ramp, data_range, reset=True):
+    """Create a material mapping the raw values stored in an image to
+    colors, through the given range and color ramp, and apply it to the
+    given mesh. Works only with cycles.
+    """
+    name = image_material_prefix + name
+    mat, flag = material(mesh, name, reset)
+    # The tree is set up every time, so that the scalar chain is
+    # linked again even if the nodes already exist
+    setup_scalar_image_tree(mat, img)
+    update_scalar_nodes(mat.node_tree.nodes, ramp, data_range)
+    return mat
+
+
+def refresh_scalar_material(name, ramp, data_range):
+    """Set the range and color ramp of an existing raw values image
+    material. Return False if there is no such material.
+    """
+    mat = bpy.data.materials.get(image_material_prefix + name)
+    if not mat or not mat.use_nodes or not is_scalar_tree(mat):
+        return False
+    update_scalar_nodes(mat.node_tree.nodes, ramp, data_range)
+    return True
+
+
 def voxel_material(mesh, name, file_path, texture=None, reset=True):
     """Create a voxel material and apply it to the given mesh.
     Works only with blender render engine."""
@@ -218,8 +246,13 @@ def setup_image_tree(mat, image):
 
     # mat.use_nodes = True
     nodes = mat.node_tree.nodes
+    # Remove the nodes mapping raw values, left by shader colors
+    for node_name in (range_min_node_name, range_scale_node_name, ramp_node_name):
+        for node in get_customized_nodes(nodes, node_name):
+            nodes.remove(node)
     img_node = get_node_by_idname(nodes, "ShaderNodeTexImage")
     customize_image_node(img_node)
+    img_node.color_space = "COLOR"
     shader_node = get_node_by_idname(nodes, "ShaderNodeBsdfDiffuse")
     out_node = get_node_by_idname(nodes, "ShaderNodeOutputMaterial")
     uv_node = get_node_by_idname(nodes, "ShaderNodeUVMap")
@@ -231,6 +264,48 @@ def setup_image_tree(mat, image):
     uv_node.uv_map = default_uv_map
 
 
+def setup_scalar_image_tree(mat, image):
+    setup_diffuse_tree(mat)
+
+    nodes = mat.node_tree.nodes
+    img_node = get_node_by_idname(nodes, "ShaderNodeTexImage")
+    customize_image_node(img_node)
+    # The image stores raw values, not colors
+    img_node.color_space = "NONE"
+    min_node = get_customized_node(nodes, "ShaderNodeMath", range_min_node_name)
+    min_node.operation = "SUBTRACT"
+    scale_node = get_customized_node(nodes, "ShaderNodeMath", range_scale_node_name)
+    scale_node.operation = "MULTIPLY"
+    scale_node.use_clamp = True
+    ramp_node = get_node_by_idname(nodes, "ShaderNodeValToRGB")
+    customize_ramp_node(ramp_node)
+    shader_node = get_node_by_idname(nodes, "ShaderNodeBsdfDiffuse")
+    uv_node = get_node_by_idname(nodes, "ShaderNodeUVMap")
+    links = mat.node_tree.links
+    link_nodes(uv_node, "UV", img_node, "Vector", links)
+    # Math nodes have two inputs with the same name
+    links.new(min_node.inputs[0], img_node.outputs["Color"])
+    links.new(scale_node.inputs[0], min_node.outputs["Value"])
+    link_nodes(scale_node, "Value", ramp_node, "Fac", links)
+    link_nodes(ramp_node, "Color", shader_node, "Color", links)
+    img_node.image = image
+    uv_node.uv_map = default_uv_map
+
+
+def is_scalar_tree(mat):
+    """Return True if the node tree of the material maps raw values."""
+    return bool(get_customized_nodes(mat.node_tree.nodes, range_min_node_name))
+
+
+def update_scalar_nodes(nodes, ramp, data_range):
+    min_r, max_r = data_range
+    for node in get_customized_nodes(nodes, range_min_node_name):
+        node.inputs[1].default_value = min_r
+    for node in get_customized_nodes(nodes, range_scale_node_name):
+        node.inputs[1].default_value = 1 / (max_r - min_r)
+    update_ramp_nodes(nodes, ramp)
+
+
 def new_image_node(nodes, img):
     img_node = nodes.new("ShaderNodeTexImage")
     img_node.image = img
@@ -258,6 +333,16 @@ def get_customized_nodes(nodes, node_name):
     return c_nodes
 
 
+def get_customized_node(nodes, idname, node_name):
+    """Get the customized node with the given name, or create it."""
+    c_nodes = get_customized_nodes(nodes, node_name)
+    if c_nodes:
+        return c_nodes[0]
+    node = nodes.new(idname)
+    customize_node(node, node_name)
+    return node
+
+
 def customize_image_node(node):
     customize_node(node, image_node_name)
 
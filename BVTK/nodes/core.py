@@ -148,6 +148,21 @@ class BVTK_AddonPreferences(AddonPreferences):
     output_path = bpy.props.StringProperty(default=os.path.join(addon_path, "tmp"),
                                            subtype="FILE_PATH")
     draw_windows = bpy.props.BoolProperty(default=True)
+    volume_slab_size = bpy.props.IntProperty(default=256, min=1, subtype="UNSIGNED",
+                                             description="Memory used to write volume files, "
+                                                         "in megabytes. Volumes are written one "
+                                                         "z slab at a time within this budget")
+    volume_cache_size = bpy.props.IntProperty(default=2048, min=1, subtype="UNSIGNED",
+                                              description="Disk space used by the volume files in "
+                                                          "the output directory, in megabytes. The "
+                                                          "least recently used ones are deleted "
+                                                          "beyond this size")
+    probe_memory = bpy.props.IntProperty(default=1024, min=1, subtype="UNSIGNED",
+                                         description="Memory used by the slabs probed at the "
+                                                     "same time, in megabytes")
+    probe_threads = bpy.props.IntProperty(default=0, min=0, subtype="UNSIGNED",
+                                          description="Number of threads probing volume slabs "
+                                                      "concurrently (0 for one per core)")
 
     def get_log_level(self):
         log_lev = log.python_log.getEffectiveLevel()
@@ -178,6 +193,10 @@ class BVTK_AddonPreferences(AddonPreferences):
         layout.prop(self, "output_path", text="Output directory")
         layout.prop(self, "logging_level", text="Logging detail")
         layout.prop(self, "draw_windows", text="Draw log windows")
+        layout.prop(self, "volume_slab_size", text="Volume slab size (MB)")
+        layout.prop(self, "volume_cache_size", text="Volume cache size (MB)")
+        layout.prop(self, "probe_memory", text="Probe memory (MB)")
+        layout.prop(self, "probe_threads", text="Probe threads")
 
 
 # ---------------------------------------------------------------------------------
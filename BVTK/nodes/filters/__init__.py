@@ -7,6 +7,7 @@
 
 
 from ... utilities import node_prop_path
+from .. converters.converter import set_probe_locator
 from . gen_vtk_filters import *
 from . gen_vtk_filters1 import *
 from . gen_vtk_filters2 import *
@@ -426,6 +427,85 @@ class BVTK_NT_ArrayCalculator(Node, BVTK_NodePanels, BVTK_Node):
         return []
 
 
+# ---------------------------------------------------------------------------------
+#   Probe classes
+# ---------------------------------------------------------------------------------
+
+
+class BVTK_ProbeHelper:
+    """Base class for probe filters. The cell locator of the source
+    is taken from the cache of static cell locators, so that probing
+    a source with unchanged geometry doesn't rebuild it.
+    """
+
+    def apply_inputs(self, vtkobj):
+        super().apply_inputs(vtkobj)
+        if vtkobj.GetNumberOfInputConnections(1):
+            source = vtkobj.GetInputDataObject(1, 0)
+            if source:
+                set_probe_locator(vtkobj, source)
+
+
+class BVTK_NT_ProbeFilter(BVTK_ProbeHelper, Node, BVTK_Node):
+    bl_idname = "BVTK_NT_ProbeFilter"
+    bl_label = "vtkProbeFilter"
+
+    m_CategoricalData = bpy.props.BoolProperty(name='CategoricalData', description='Control whether the source point data is to be treated as categorical. If the data is categorical, then the resultant data will be determined by a nearest neighbor interpolation scheme', default=True)
+    m_ComputeTolerance = bpy.props.BoolProperty(name='ComputeTolerance', description='Set whether to use the Tolerance field or precompute the tolerance. When on, the tolerance will be computed and the field value is ignored. Off by default', default=True)
+    m_PassCellArrays = bpy.props.BoolProperty(name='PassCellArrays', description='Shallow copy the input cell data arrays to the output. Off by default', default=True)
+    m_PassFieldArrays = bpy.props.BoolProperty(name='PassFieldArrays', description='Set whether to pass the field-data arrays from the Input i.e. the input providing the geometry to the output. On by default', default=True)
+    m_PassPointArrays = bpy.props.BoolProperty(name='PassPointArrays', description='Shallow copy the input point data arrays to the output Off by default', default=True)
+    m_SpatialMatch = bpy.props.BoolProperty(name='SpatialMatch', description='This flag is used only when a piece is requested to update. By default the flag is off. Because no spatial correspondence between input pieces and source pieces is known, all of the source has to be requested no matter what piece of the output is requested. When there is a spatial correspondence, the user/application can set this flag. This hint allows the breakup of the probe operation to be much more efficient. When piece m of n is requested for update by the user, then only n of m needs to be requested of the source', default=True)
+    m_Tolerance = bpy.props.FloatProperty(name='Tolerance', description='Set the tolerance used to compute whether a point in the source is in a cell of the input. This value is only used if ComputeTolerance is off', default=1.0)
+    m_ValidPointMaskArrayName = bpy.props.StringProperty(name='ValidPointMaskArrayName', description='Returns the name of the char array added to the output with values 1 for valid points and 0 for invalid points. Set to "vtkValidPointMask" by default', default='vtkValidPointMask')
+
+    b_properties = bpy.props.BoolVectorProperty(name="", size=8, get=BVTK_Node.get_b, set=BVTK_Node.set_b)
+
+    def m_properties(self):
+        return ["m_CategoricalData", "m_ComputeTolerance", "m_PassCellArrays", "m_PassFieldArrays", "m_PassPointArrays", "m_SpatialMatch", "m_Tolerance", "m_ValidPointMaskArrayName", ]
+
+    def m_connections(self):
+        return ['Input 0', 'Input 1'], ['Output'], [], ['Self']
+
+    def methods(self):
+        return []
+
+
+add_node(BVTK_NT_ProbeFilter)
+
+
+# --------------------------------------------------------------
+
+
+class BVTK_NT_CompositeDataProbeFilter(BVTK_ProbeHelper, Node, BVTK_Node):
+    bl_idname = "BVTK_NT_CompositeDataProbeFilter"
+    bl_label = "vtkCompositeDataProbeFilter"
+
+    m_CategoricalData = bpy.props.BoolProperty(name='CategoricalData', description='Control whether the source point data is to be treated as categorical. If the data is categorical, then the resultant data will be determined by a nearest neighbor interpolation scheme', default=True)
+    m_ComputeTolerance = bpy.props.BoolProperty(name='ComputeTolerance', description='Set whether to use the Tolerance field or precompute the tolerance. When on, the tolerance will be computed and the field value is ignored. Off by default', default=True)
+    m_PassCellArrays = bpy.props.BoolProperty(name='PassCellArrays', description='Shallow copy the input cell data arrays to the output. Off by default', default=True)
+    m_PassFieldArrays = bpy.props.BoolProperty(name='PassFieldArrays', description='Set whether to pass the field-data arrays from the Input i.e. the input providing the geometry to the output. On by default', default=True)
+    m_PassPartialArrays = bpy.props.BoolProperty(name='PassPartialArrays', description='When dealing with composite datasets, partial arrays are common i.e. data-arrays that are not available in all of the blocks. By default, this filter only passes those point and cell data-arrays that are available in all the blocks i.e. partial array are removed. When PassPartialArrays is turned on, this behavior is changed to take a union of all arrays present thus partial arrays are passed as well. However, for composite dataset input, this filter still produces a non-composite output. For all those locations in a block of where a particular data array is missing, this filter uses vtkMath::Nan() for double and float arrays, while 0 for all other types of arrays i.e int, char etc', default=False)
+    m_PassPointArrays = bpy.props.BoolProperty(name='PassPointArrays', description='Shallow copy the input point data arrays to the output Off by default', default=True)
+    m_SpatialMatch = bpy.props.BoolProperty(name='SpatialMatch', description='This flag is used only when a piece is requested to update. By default the flag is off. Because no spatial correspondence between input pieces and source pieces is known, all of the source has to be requested no matter what piece of the output is requested. When there is a spatial correspondence, the user/application can set this flag. This hint allows the breakup of the probe operation to be much more efficient. When piece m of n is requested for update by the user, then only n of m needs to be requested of the source', default=True)
+    m_Tolerance = bpy.props.FloatProperty(name='Tolerance', description='Set the tolerance used to compute whether a point in the source is in a cell of the input. This value is only used if ComputeTolerance is off', default=1.0)
+    m_ValidPointMaskArrayName = bpy.props.StringProperty(name='ValidPointMaskArrayName', description='Returns the name of the char array added to the output with values 1 for valid points and 0 for invalid points. Set to "vtkValidPointMask" by default', default='vtkValidPointMask')
+
+    b_properties = bpy.props.BoolVectorProperty(name="", size=9, get=BVTK_Node.get_b, set=BVTK_Node.set_b)
+
+    def m_properties(self):
+        return ["m_CategoricalData", "m_ComputeTolerance", "m_PassCellArrays", "m_PassFieldArrays", "m_PassPartialArrays", "m_PassPointArrays", "m_SpatialMatch", "m_Tolerance", "m_ValidPointMaskArrayName", ]
+
+    def m_connections(self):
+        return ['Input 0', 'Input 1'], ['Output'], [], ['Self']
+
+    def methods(self):
+        return []
+
+
+add_node(BVTK_NT_CompositeDataProbeFilter)
+
+
 register.add_class(BVTK_PG_ValueSettings)
 register.add_class(BVTK_OT_UpdateCollection)
 register.add_class(BVTK_PG_ArrayCalculatorVariable)